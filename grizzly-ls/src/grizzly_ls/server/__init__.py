@@ -4,17 +4,22 @@ import platform
 import signal
 import re
 import sys
+import threading
 
 from os import environ
-from os.path import pathsep, sep
+from concurrent.futures import Future
+from os.path import devnull, pathsep
+from configparser import ConfigParser, Error as ConfigParserError
 from typing import (
     Any,
     Deque,
     Tuple,
     Dict,
+    FrozenSet,
     List,
     Union,
     Optional,
+    Sequence,
     Set,
     cast,
 )
@@ -24,12 +29,8 @@ from behave.matchers import ParseMatcher
 from venv import create as venv_create
 from tempfile import gettempdir
 from urllib.parse import urlparse, unquote
-from urllib.request import url2pathname
-from pip._internal.configuration import Configuration as PipConfiguration
-from pip._internal.exceptions import ConfigurationError as PipConfigurationError
-from time import sleep
 from collections import deque
-from logging import ERROR
+from logging import DEBUG, ERROR
 
 from pygls.server import LanguageServer
 from pygls.workspace import TextDocument
@@ -37,14 +38,13 @@ from pygls.capabilities import get_capability
 from lsprotocol import types as lsp
 
 from grizzly_ls import __version__
-from grizzly_ls.text import Normalizer, get_step_parts
-from grizzly_ls.utils import run_command, LogOutputChannelLogger
+from grizzly_ls.text import Normalizer, get_step_parts, get_expression_shell
+from grizzly_ls.utils import run_command_iter, LogOutputChannelLogger
 from grizzly_ls.model import Step
 from grizzly_ls.constants import FEATURE_INSTALL, COMMAND_REBUILD_INVENTORY, COMMAND_RUN_DIAGNOSTICS, COMMAND_RENDER_GHERKIN, LANGUAGE_ID
 from grizzly_ls.text import (
     format_arg_line,
-    find_language,
-    get_current_line,
+    find_language_header,
 )
 
 from .progress import Progress
@@ -59,33 +59,136 @@ from .features.completion import (
 from .features.definition import get_step_definition, get_file_url_definition
 from .features.diagnostics import validate_gherkin
 from .features.code_actions import generate_quick_fixes
-from .inventory import compile_inventory, compile_keyword_inventory
+from .inventory import LanguageKeywords, StepIndex, compile_inventory, compile_keyword_inventory
 from .commands import render_gherkin
 
 
+_DRIVE_LETTER_PATH = re.compile(r'^/[A-Za-z]:')
+_UNBOUNDED_WILDCARD = re.compile(r'(?<!\\)[*+]\??\.\*')
+_END_ANCHOR = re.compile(r'(?<!\\)(?:\\\\)*\$$')
+
+
+def _signal(signum: Union[int, signal.Signals], frame: FrameType) -> None:
+    return
+
+
+def _uri_to_path(uri: str) -> Path:
+    # not using Path.from_uri (3.12+), it does not handle percent-encoded drive letters (file:///c%3A/...)
+    parsed_uri = urlparse(uri)
+    path = unquote(parsed_uri.path)
+
+    # file:///c:/... or file:///c%3A/..., drive letter should not be prefixed with a separator
+    if _DRIVE_LETTER_PATH.match(path):
+        path = path[1:]
+    elif parsed_uri.netloc not in ['', 'localhost']:  # file://server/share/..., UNC path
+        path = f'//{parsed_uri.netloc}{path}'
+
+    return Path(path)
+
+
+def _get_pip_config_files() -> List[Path]:
+    # same files, and order of precedence (global < user < site < environment, last wins), as pip
+    config_files: List[Path] = []
+    config_file = environ.get('PIP_CONFIG_FILE', None)
+    basename = 'pip.ini' if sys.platform == 'win32' else 'pip.conf'
+
+    # pip does not load any configuration files if environment configuration file is the null device
+    if config_file == devnull:
+        return config_files
+
+    if sys.platform == 'win32':  # pragma: no cover
+        config_files.append(Path(environ.get('PROGRAMDATA', 'C:\\ProgramData')) / 'pip' / basename)
+    elif sys.platform == 'darwin':  # pragma: no cover
+        config_files.append(Path('/Library/Application Support/pip') / basename)
+    else:
+        xdg_config_dirs = environ.get('XDG_CONFIG_DIRS', None) or '/etc/xdg'
+        config_files.extend([Path(xdg_config_dir) / 'pip' / basename for xdg_config_dir in xdg_config_dirs.split(pathsep)])
+        config_files.append(Path('/etc') / basename)
+
+    # user configuration is not loaded if an existing configuration file is specified in environment
+    if not (config_file and Path(config_file).exists()):
+        home = Path.home()
+        config_files.append(home / ('pip' if sys.platform == 'win32' else '.pip') / basename)
+
+        if sys.platform == 'win32':  # pragma: no cover
+            config_files.append(Path(environ.get('APPDATA', home)) / 'pip' / basename)
+        elif sys.platform == 'darwin' and (home / 'Library' / 'Application Support' / 'pip').is_dir():  # pragma: no cover
+            config_files.append(home / 'Library' / 'Application Support' / 'pip' / basename)
+        else:
+            config_files.append(Path(environ.get('XDG_CONFIG_HOME') or str(home / '.config')) / 'pip' / basename)
+
+    config_files.append(Path(sys.prefix) / basename)
+
+    if config_file is not None:
+        config_files.append(Path(config_file))
+
+    return config_files
+
+
+def _read_pip_index_url() -> Optional[str]:
+    """Get `global.index-url` from pip configuration files, without having to load pip internals."""
+    index_url: Optional[str] = None
+
+    for config_file in _get_pip_config_files():
+        parser = ConfigParser(interpolation=None)
+
+        try:
+            # files that does not exist are ignored
+            parser.read(config_file, encoding='utf-8')
+        except ConfigParserError:
+            return None
+
+        if not parser.has_section('global'):
+            continue
+
+        # pip treats index_url and index-url as the same option
+        for name, value in parser.items('global'):
+            if name.replace('_', '-') == 'index-url':
+                index_url = value
+
+    return index_url
+
+
 class GrizzlyLanguageServer(LanguageServer):
     logger: LogOutputChannelLogger
 
-    variable_pattern: re.Pattern[str] = re.compile(r'(.*ask for value of variable "([^"]*)"$|.*value for variable "([^"]*)" is ".*?"$)')
+    variable_pattern: re.Pattern[str] = re.compile(r'^.*(?:ask for value of variable "([^"]*)"|value for variable "([^"]*)" is ".*?")$')
+    _variable_pattern_cache: Dict[Tuple[str, ...], re.Pattern[str]]
 
     file_ignore_patterns: List[str]
-    root_path: Path
+    _root_path: Path
+    requests_path: Path
     index_url: Optional[str]
     behave_steps: Dict[str, List[ParseMatcher]]
     steps: Dict[str, List[Step]]
     keywords: List[str]
+    keywords_lookup: FrozenSet[str]
     keywords_once: List[str] = []
-    keywords_any: List[str] = []
-    keywords_headers: List[str] = []
-    keywords_all: List[str] = []
+    keywords_once_pattern: re.Pattern[str] = re.compile(r'(?!)')
+    keywords_scenario_pattern: re.Pattern[str] = re.compile(r'(?!)')
+    keywords_any: FrozenSet[str] = frozenset()
+    keywords_headers: FrozenSet[str] = frozenset()
+    keywords_all: FrozenSet[str] = frozenset()
     client_settings: Dict[str, Any]
     startup_messages: Deque[Tuple[str, int]]
 
     _language: str
     localizations: Dict[str, List[str]]
+    keyword_to_key: Dict[str, str]
 
     normalizer: Normalizer
 
+    _step_index: Optional[StepIndex]
+    _ready: threading.Event
+    _rebuild_lock: threading.Lock
+    _line_cache: Dict[str, Tuple[int, List[str]]]
+    _diagnostics_cache: Dict[str, Tuple[Tuple[int, StepIndex], List[lsp.Diagnostic]]]
+    _language_cache: Dict[str, Tuple[str, int]]
+    _diagnostics_lock: threading.Lock
+    _diagnostics_pending: Dict[str, object]
+    _quick_fix_file_cache: Dict[Path, Tuple[Path, str]]
+    _line_count_cache: Dict[Path, Tuple[int, int]]
+
     markup_kind: lsp.MarkupKind
 
     def add_startup_error_message(self, message: str) -> None:
@@ -99,25 +202,38 @@ class GrizzlyLanguageServer(LanguageServer):
         self.index_url = environ.get('PIP_EXTRA_INDEX_URL', None)
         self.behave_steps = {}
         self.steps = {}
+        self._step_index = None
+        self._ready = threading.Event()
+        self._ready.set()  # only cleared while installing, or rebuilding inventory
+        self._rebuild_lock = threading.Lock()
+        self._line_cache = {}
+        self._diagnostics_cache = {}
+        self._language_cache = {}
+        self._diagnostics_lock = threading.Lock()
+        self._diagnostics_pending = {}
+        self._quick_fix_file_cache = {}
+        self._line_count_cache = {}
+        self._variable_pattern_cache = {}
         self.keywords = []
+        self.keywords_lookup = frozenset()
         self.markup_kind = lsp.MarkupKind.Markdown  # assume, until initialized request
         self.language = 'en'  # assumed default
         self.file_ignore_patterns = []
         self.startup_messages = deque()
 
-        # monkey patch functions to short-circuit them (causes problems in this context)
-        try:
-            import gevent.monkey  # type: ignore
+        # short-circuit signal handlers registered by step modules (causes problems in this context)
+        if signal.signal is not _signal and threading.current_thread() is threading.main_thread():
+            signal.signal = _signal  # type: ignore
+        self.client_settings = {}
 
-            gevent.monkey.patch_all = lambda: None
-        except ModuleNotFoundError:
-            pass
+    @property
+    def root_path(self) -> Path:
+        return self._root_path
 
-        def _signal(signum: Union[int, signal.Signals], frame: FrameType) -> None:
-            return
-
-        signal.signal = _signal  # type: ignore
-        self.client_settings = {}
+    @root_path.setter
+    def root_path(self, value: Path) -> None:
+        self._root_path = value
+        self.requests_path = value / 'features' / 'requests'
 
     @property
     def language(self) -> str:
@@ -131,19 +247,112 @@ class GrizzlyLanguageServer(LanguageServer):
             name = self.localizations.get('name', ['unknown'])[0]
             self.logger.info(f'language detected: {name} ({value})')
 
+    def detect_language(self, text_document: TextDocument, content_changes: Optional[Sequence[lsp.TextDocumentContentChangeEvent]] = None) -> None:
+        """Set language based on the language marker in the document.
+
+        If all changes are after the line where the marker was searched for last time, the language can not have changed.
+        """
+        cached = self._language_cache.get(text_document.uri, None)
+
+        if (
+            cached is not None
+            and content_changes is not None
+            and all(isinstance(change, lsp.TextDocumentContentChangeEvent_Type1) and change.range.start.line > cached[1] for change in content_changes)
+        ):
+            language = cached[0]
+        else:
+            language, lineno = find_language_header(text_document.source)
+            if lineno is not None:
+                self._language_cache[text_document.uri] = (language, lineno)
+            else:
+                self._language_cache.pop(text_document.uri, None)
+
+        try:
+            self.language = language
+        except ValueError:
+            self.language = 'en'
+
     def get_language_key(self, keyword: str) -> str:
         keyword = keyword.rstrip(' :')
 
-        for key, values in self.localizations.items():
-            if keyword in values:
-                return key
+        key = self.keyword_to_key.get(keyword, None)
+        if key is not None:
+            return key
 
         raise ValueError(f'"{keyword}" is not a valid keyword for "{self.language}"')
 
-    def get_base_keyword(self, position: lsp.Position, text_document: TextDocument) -> str:
-        lines = list(reversed(text_document.source.splitlines()[: position.line + 1]))
+    def get_lines(self, text_document: TextDocument) -> List[str]:
+        """Lines of a document, reused until the document version changes. Only split on line feeds, so carriage returns are kept."""
+        version = text_document.version
+        cached = self._line_cache.get(text_document.uri, None)
+
+        if cached is not None and version is not None and cached[0] == version:
+            lines = cached[1]
+        else:
+            lines = text_document.source.split('\n')
+            if version is not None:
+                self._line_cache[text_document.uri] = (version, lines)
 
-        current_line = lines[0]
+        return lines
+
+    def get_current_line(self, text_document: TextDocument, position: lsp.Position) -> str:
+        """Same as `grizzly_ls.text.get_current_line`, but the lines of a document is reused until the document version changes."""
+        return self.get_lines(text_document)[position.line]
+
+    def get_diagnostics(self, text_document: TextDocument, *, force: bool = False) -> List[lsp.Diagnostic]:
+        """Validate the document, diagnostics are reused until the document version or step inventory changes."""
+        version = text_document.version
+        if version is None:
+            return validate_gherkin(self, text_document)
+
+        # language of the document is part of the document, so it is covered by the version
+        key = (version, self.step_index)
+        cached = self._diagnostics_cache.get(text_document.uri, None)
+
+        if not force and cached is not None and cached[0] == key:
+            return cached[1]
+
+        diagnostics = validate_gherkin(self, text_document)
+        self._diagnostics_cache[text_document.uri] = (key, diagnostics)
+
+        return diagnostics
+
+    def publish_diagnostics_in_background(self, text_document: TextDocument, *, force: bool = False) -> Future[None]:
+        """Validate the document and publish the diagnostics in the thread pool, so that other requests are not blocked meanwhile.
+
+        Only the latest requested validation of a document is done, earlier ones that has not started yet are skipped.
+        """
+        token = object()
+        self._diagnostics_pending[text_document.uri] = token
+
+        def publish() -> None:
+            # one at the time, so a newer validation of a document is always published last
+            with self._diagnostics_lock:
+                if self._diagnostics_pending.get(text_document.uri, None) is not token:
+                    return
+
+                # inventory is being compiled, all open documents are validated when it is done
+                if not self._ready.is_set():
+                    return
+
+                try:
+                    diagnostics = self.get_diagnostics(text_document, force=force)
+                    self.publish_diagnostics(text_document.uri, diagnostics)  # type: ignore
+                except:
+                    self.logger.exception(f'failed to run diagnostics on {text_document.uri}', notify=True)
+
+        return self.thread_pool_executor.submit(publish)
+
+    def get_base_keyword(self, position: lsp.Position, text_document: TextDocument, language_keywords: Optional[LanguageKeywords] = None) -> str:
+        """Get the keyword that an any keyword (e.g. `And`) on the line belongs to, by default with the keywords of the current language."""
+        keywords_any = self.keywords_any if language_keywords is None else language_keywords.keywords_any
+        keywords_all = self.keywords_all if language_keywords is None else language_keywords.keywords_all
+        lines = self.get_lines(text_document)
+        # positions after the last line ends up on the last line, and as with str.splitlines, a trailing line break does not start a new line
+        last_lineno = len(lines) - 2 if len(lines) > 1 and lines[-1] == '' else len(lines) - 1
+        lineno = min(position.line, last_lineno)
+
+        current_line = lines[lineno]
         base_keyword, _ = get_step_parts(current_line)
 
         if base_keyword is None:
@@ -151,25 +360,34 @@ class GrizzlyLanguageServer(LanguageServer):
 
         base_keyword = base_keyword.rstrip(' :')
 
-        if base_keyword not in self.keywords_any and base_keyword in self.keywords_all:
+        if base_keyword not in keywords_any and base_keyword in keywords_all:
             return base_keyword
 
-        for line in lines[1:]:
-            step_keyword, _ = get_step_parts(line)
+        # walk upwards from the current line, only as far as needed
+        for index in range(lineno - 1, -1, -1):
+            step_keyword, _ = get_step_parts(lines[index])
 
             if step_keyword is None:
                 continue
 
             step_keyword = step_keyword.rstrip(' :')
 
-            if step_keyword not in self.keywords_all:
+            if step_keyword not in keywords_all:
                 continue
 
-            if step_keyword not in self.keywords_any:
+            if step_keyword not in keywords_any:
                 return step_keyword
 
         return base_keyword
 
+    @property
+    def step_index(self) -> StepIndex:
+        # steps can be changed from many places, rebuild index when they have
+        if self._step_index is None or not self._step_index.is_current(self.steps):
+            self._step_index = StepIndex(self.steps)
+
+        return self._step_index
+
     def _normalize_step_expression(self, step: Union[ParseMatcher, str]) -> List[str]:
         if isinstance(step, ParseMatcher):
             pattern = step.pattern
@@ -186,28 +404,17 @@ class GrizzlyLanguageServer(LanguageServer):
         if expression is None or keyword is None:
             return None
 
-        possible_help: Dict[str, str] = {}
-
         key = self.get_language_key(keyword)
-        expression = re.sub(r'"[^"]*"', '""', expression)
-
-        for steps in self.steps.values():
-            for step in steps:
-                if step.expression.strip() == expression.strip() and (key == keyword or key == 'step'):
-                    return step.help
-                elif step.expression.startswith(expression) and step.help is not None:
-                    possible_help.update({step.expression: step.help})
-
-        if len(possible_help) < 1:
-            return None
+        expression = get_expression_shell(expression)
 
-        return possible_help[sorted(possible_help.keys(), reverse=True)[0]]
+        return self.step_index.find_help(expression, exact=key == keyword or key == 'step')
 
 
 server = GrizzlyLanguageServer()
 
 
 @server.feature(FEATURE_INSTALL)
+@server.thread()
 def install(ls: GrizzlyLanguageServer, *args: Any) -> None:
     """
     See https://microsoft.github.io/language-server-protocol/specifications/lsp/3.17/specification/#initialize
@@ -218,161 +425,203 @@ def install(ls: GrizzlyLanguageServer, *args: Any) -> None:
 
     This custom feature handles being able to send progress report of the, slow, process of installing dependencies needed
     for it to function properly on the project it is being used.
+
+    It runs in a worker thread, so other messages can be handled meanwhile. Requests that needs the inventory will
+    get empty results until it is done.
     """
     ls.logger.debug(f'{FEATURE_INSTALL}: installing')
 
-    try:
-        with Progress(ls.progress, 'grizzly-ls') as progress:
-            # <!-- should a virtual environment be used?
-            use_venv = ls.client_settings.get('use_virtual_environment', True)
-            executable = 'python' if use_venv else sys.executable
-            # // -->
-
-            ls.logger.debug(f'workspace root: {ls.root_path}')
-
-            env = environ.copy()
-            project_name = ls.root_path.stem
-
-            virtual_environment: Optional[Path] = None
-            has_venv: bool = False
-
-            if use_venv:
-                virtual_environment = Path(gettempdir()) / f'grizzly-ls-{project_name}'
-                has_venv = virtual_environment.exists()
-
-                ls.logger.debug(f'looking for venv at {virtual_environment}, {has_venv=}')
-
-                if not has_venv:
-                    ls.logger.logger.debug(f'creating virtual environment: {virtual_environment}')
-                    ls.logger.info('creating virtual environment for language server, this could take a while', notify=True)
-                    try:
-                        progress.report('creating venv', 33)
-                        venv_create(str(virtual_environment), with_pip=True)
-                    except:
-                        ls.logger.exception('failed to create virtual environment', notify=True)
-                        return
+    # compiling inventory while a rebuild is in progress would mutate steps and sys.path concurrently
+    with ls._rebuild_lock:
+        ls._ready.clear()
 
-                if platform.system() == 'Windows':  # pragma: no cover
-                    bin_dir = 'Scripts'
-                else:
-                    bin_dir = 'bin'
-
-                paths = [
-                    str(virtual_environment / bin_dir),
-                    env.get('PATH', ''),
-                ]
-                env.update(
-                    {
-                        'PATH': pathsep.join(paths),
-                        'VIRTUAL_ENV': str(virtual_environment),
-                        'PYTHONPATH': str(ls.root_path / 'features'),
-                    }
-                )
+        try:
+            with Progress(ls.progress, 'grizzly-ls') as progress:
+                # <!-- should a virtual environment be used?
+                use_venv = ls.client_settings.get('use_virtual_environment', True)
+                executable = 'python' if use_venv else sys.executable
+                # // -->
 
-                if ls.index_url is not None:
-                    index_url_parsed = urlparse(ls.index_url)
-                    if index_url_parsed.username is None or index_url_parsed.password is None:
-                        ls.logger.error(
-                            'global.index-url does not contain username and/or password, check your configuration!',
-                            notify=True,
-                        )
-                        return
+                ls.logger.debug(f'workspace root: {ls.root_path}')
 
-                    env.update(
-                        {
-                            'PIP_EXTRA_INDEX_URL': ls.index_url,
-                        }
-                    )
+                # only copy environment if it needs to be modified, otherwise it is inherited
+                env: Optional[Dict[str, str]] = None
+                project_name = ls.root_path.stem
 
-            requirements_file = ls.root_path / 'requirements.txt'
-            if not requirements_file.exists():
-                ls.logger.error(
-                    f'project "{project_name}" does not have a requirements.txt in {ls.root_path}',
-                    notify=True,
-                )
-                return
+                virtual_environment: Optional[Path] = None
+                has_venv: bool = False
 
-            project_age_file = Path(gettempdir()) / f'grizzly-ls-{project_name}' / '.age'
-
-            # pip install (slow operation) if:
-            # - age file does not exist
-            # - requirements file has been modified since age file was last touched
-            if not project_age_file.exists() or (requirements_file.lstat().st_mtime > project_age_file.lstat().st_mtime):
-                action = 'install' if not project_age_file.exists() else 'upgrade'
-
-                ls.logger.debug(f'{action} from {requirements_file}')
-
-                # <!-- install dependencies
-                progress.report(f'{action} dependencies', 50)
-
-                rc, output = run_command(
-                    [
-                        executable,
-                        '-m',
-                        'pip',
-                        'install',
-                        '--upgrade',
-                        '-r',
-                        str(requirements_file),
-                    ],
-                    env=env,
-                )
+                if use_venv:
+                    virtual_environment = Path(gettempdir()) / f'grizzly-ls-{project_name}'
+                    has_venv = virtual_environment.exists()
+
+                    ls.logger.debug(f'looking for venv at {virtual_environment}, {has_venv=}')
 
-                for line in output:
-                    if line.strip().startswith('ERROR:'):
-                        _, line = line.split(' ', 1)
-                        log_method = ls.logger.error
-                    elif rc == 0:
-                        log_method = ls.logger.debug
+                    if not has_venv:
+                        ls.logger.logger.debug(f'creating virtual environment: {virtual_environment}')
+                        ls.logger.info('creating virtual environment for language server, this could take a while', notify=True)
+                        try:
+                            progress.report('creating venv', 33)
+                            venv_create(str(virtual_environment), with_pip=True)
+                        except:
+                            ls.logger.exception('failed to create virtual environment', notify=True)
+                            return
+
+                    if platform.system() == 'Windows':  # pragma: no cover
+                        bin_dir = 'Scripts'
                     else:
-                        log_method = ls.logger.warning
+                        bin_dir = 'bin'
 
-                    if len(line.strip()) > 1:
-                        log_method(line.strip())
+                    env = environ.copy()
+                    paths = [
+                        str(virtual_environment / bin_dir),
+                        env.get('PATH', ''),
+                    ]
+                    env.update(
+                        {
+                            'PATH': pathsep.join(paths),
+                            'VIRTUAL_ENV': str(virtual_environment),
+                            'PYTHONPATH': str(ls.root_path / 'features'),
+                        }
+                    )
 
-                ls.logger.debug(f'{action} done {rc=}')
+                    if ls.index_url is not None:
+                        index_url_parsed = urlparse(ls.index_url)
+                        if index_url_parsed.username is None or index_url_parsed.password is None:
+                            ls.logger.error(
+                                'global.index-url does not contain username and/or password, check your configuration!',
+                                notify=True,
+                            )
+                            return
+
+                        env.update(
+                            {
+                                'PIP_EXTRA_INDEX_URL': ls.index_url,
+                            }
+                        )
 
-                if rc != 0:
+                requirements_file = ls.root_path / 'requirements.txt'
+                try:
+                    requirements_age = requirements_file.stat().st_mtime
+                except FileNotFoundError:
                     ls.logger.error(
-                        f'failed to {action} from {requirements_file}',
+                        f'project "{project_name}" does not have a requirements.txt in {ls.root_path}',
                         notify=True,
                     )
                     return
 
-                project_age_file.parent.mkdir(parents=True, exist_ok=True)
-                project_age_file.touch()
-                # // -->
+                project_age_file = Path(gettempdir()) / f'grizzly-ls-{project_name}' / '.age'
 
-            if use_venv and virtual_environment is not None:
-                # modify sys.path to use modules from virtual environment when compiling inventory
-                venv_sys_path = virtual_environment / 'lib' / f'python{sys.version_info.major}.{sys.version_info.minor}/site-packages'
-                sys.path.append(str(venv_sys_path))
+                # pip install (slow operation) if:
+                # - age file does not exist
+                # - requirements file has been modified since age file was last touched
+                project_age: Optional[float]
+                try:
+                    project_age = project_age_file.stat().st_mtime
+                except FileNotFoundError:
+                    project_age = None
+
+                if project_age is None or requirements_age > project_age:
+                    action = 'install' if project_age is None else 'upgrade'
+
+                    ls.logger.debug(f'{action} from {requirements_file}')
+
+                    # <!-- install dependencies
+                    progress.report(f'{action} dependencies', 50)
+
+                    lines = run_command_iter(
+                        [
+                            executable,
+                            '-m',
+                            'pip',
+                            'install',
+                            '--upgrade',
+                            '--no-input',
+                            '--disable-pip-version-check',
+                            '-r',
+                            str(requirements_file),
+                        ],
+                        env=env,
+                    )
+
+                    # log output as pip writes it, only keep the last lines to be able to show them if the install fails
+                    last_lines: Deque[str] = deque(maxlen=50)
+                    percentage = 50
+                    rc = -1  # return code of the command, set when all output has been read
+
+                    while True:
+                        try:
+                            line = next(lines)
+                        except StopIteration as e:
+                            rc = cast(int, e.value)
+                            break
+
+                        line = line.strip()
+
+                        if line.startswith('ERROR:'):
+                            _, line = line.split(' ', 1)
+                            ls.logger.error(line)
+                            continue
+
+                        if len(line) > 1:
+                            ls.logger.debug(line)
+                            last_lines.append(line)
+
+                        if line.startswith('Collecting ') and percentage < 75:
+                            percentage += 1
+                            progress.report(f'{action} dependencies', percentage)
+                        elif line.startswith('Installing collected packages'):
+                            percentage = 80
+                            progress.report(f'{action} dependencies', percentage)
+
+                    if rc != 0:
+                        for line in last_lines:
+                            ls.logger.warning(line)
+
+                    ls.logger.debug(f'{action} done {rc=}')
+
+                    if rc != 0:
+                        ls.logger.error(
+                            f'failed to {action} from {requirements_file}',
+                            notify=True,
+                        )
+                        return
+
+                    project_age_file.parent.mkdir(parents=True, exist_ok=True)
+                    project_age_file.touch()
+                    # // -->
 
-            try:
-                # <!-- compile inventory
-                progress.report('compile inventory', 85)
-                compile_inventory(ls)
-                # // ->
-            except ModuleNotFoundError:
-                ls.logger.exception(
-                    'failed to create step inventory',
-                    notify=True,
-                )
-                return
-            finally:
                 if use_venv and virtual_environment is not None:
-                    # always restore to original value
-                    sys.path.pop()
-    except:
-        ls.logger.exception('failed to install extension', notify=True)
+                    # modify sys.path to use modules from virtual environment when compiling inventory
+                    venv_sys_path = virtual_environment / 'lib' / f'python{sys.version_info.major}.{sys.version_info.minor}/site-packages'
+                    sys.path.append(str(venv_sys_path))
+
+                try:
+                    # <!-- compile inventory
+                    progress.report('compile inventory', 85)
+                    compile_inventory(ls)
+                    # // ->
+                except ModuleNotFoundError:
+                    ls.logger.exception(
+                        'failed to create step inventory',
+                        notify=True,
+                    )
+                    return
+                finally:
+                    if use_venv and virtual_environment is not None:
+                        # always restore to original value
+                        sys.path.pop()
+        except:
+            ls.logger.exception('failed to install extension', notify=True)
+        finally:
+            ls._ready.set()
 
     try:
         for text_document in ls.workspace.text_documents.values():
             if text_document.language_id != LANGUAGE_ID:
                 continue
 
-            diagnostics = validate_gherkin(ls, text_document)
-            ls.publish_diagnostics(text_document.uri, diagnostics)  # type: ignore
+            ls.publish_diagnostics_in_background(text_document)
     except:
         ls.logger.exception('failed to run diagnostics on all opened files', notify=True)
 
@@ -394,13 +643,7 @@ def initialize(ls: GrizzlyLanguageServer, params: lsp.InitializeParams) -> None:
         ls.logger.log(level, msg, exc_info=False, notify=True)
 
     try:
-        root_path = Path(unquote(url2pathname(urlparse(params.root_uri).path))) if params.root_uri is not None else Path(cast(str, params.root_path))
-
-        # fugly as hell
-        if not root_path.exists() and str(root_path)[0:1] == sep and str(root_path)[2] == ':':
-            root_path = Path(str(root_path)[1:])
-
-        ls.root_path = root_path
+        ls.root_path = _uri_to_path(params.root_uri) if params.root_uri is not None else Path(cast(str, params.root_path))
 
         client_settings = params.initialization_options
         if client_settings is not None:
@@ -419,12 +662,7 @@ def initialize(ls: GrizzlyLanguageServer, params: lsp.InitializeParams) -> None:
         # <!-- set index url
         # no index-url specified as argument, check if we have it in pip configuration
         if ls.index_url is None:
-            pip_config = PipConfiguration(isolated=False)
-            try:
-                pip_config.load()
-                ls.index_url = pip_config.get_value('global.index-url')
-            except PipConfigurationError:
-                pass
+            ls.index_url = _read_pip_index_url()
 
         # no index-url specified in pip config, check if we have it in extension configuration
         if ls.index_url is None:
@@ -437,10 +675,17 @@ def initialize(ls: GrizzlyLanguageServer, params: lsp.InitializeParams) -> None:
 
         # <!-- set variable pattern
         variable_patterns = ls.client_settings.get('variable_pattern', [])
-        if len(variable_patterns) > 0:
-            # validate and normalize patterns
-            normalized_variable_patterns: Set[str] = set()
-            for variable_pattern in variable_patterns:
+        # alternatives are sorted when combined, so order and duplicates in the setting does not change the compiled pattern
+        variable_patterns_key = tuple(sorted(set(variable_patterns)))
+        cached_variable_pattern = ls._variable_pattern_cache.get(variable_patterns_key, None)
+        if cached_variable_pattern is not None:
+            # same patterns as already validated and compiled
+            ls.variable_pattern = cached_variable_pattern
+        elif len(variable_patterns) > 0:
+            # validate and normalize patterns, patterns not anchored at the start of the line are matched anywhere in it
+            floating_variable_patterns: Set[str] = set()
+            anchored_variable_patterns: Set[str] = set()
+            for variable_pattern in variable_patterns_key:
                 try:
                     original_variable_pattern = variable_pattern
                     if not variable_pattern.startswith('.*') and not variable_pattern.startswith('^'):
@@ -449,7 +694,8 @@ def initialize(ls: GrizzlyLanguageServer, params: lsp.InitializeParams) -> None:
                     if not variable_pattern.startswith('^'):
                         variable_pattern = f'^{variable_pattern}'
 
-                    if not variable_pattern.endswith('$'):
+                    # an escaped "$" is a literal dollar sign, not an anchor
+                    if not _END_ANCHOR.search(variable_pattern):
                         variable_pattern = f'{variable_pattern}$'
 
                     pattern = re.compile(variable_pattern)
@@ -458,7 +704,18 @@ def initialize(ls: GrizzlyLanguageServer, params: lsp.InitializeParams) -> None:
                         ls.logger.warning(f'variable pattern "{original_variable_pattern}" contains {pattern.groups} match groups, it must be exactly one', notify=True)
                         return
 
-                    normalized_variable_patterns.add(variable_pattern)
+                    if variable_pattern.startswith('^.*'):
+                        body = variable_pattern[3:-1]
+                        floating_variable_patterns.add(body)
+                    else:
+                        body = variable_pattern[1:-1]
+                        anchored_variable_patterns.add(body)
+
+                    if _UNBOUNDED_WILDCARD.search(body):
+                        ls.logger.warning(
+                            f'variable pattern "{original_variable_pattern}" has an unbounded quantifier followed by ".*", which can be slow on long lines',
+                            notify=True,
+                        )
                 except:
                     ls.logger.exception(
                         f'variable pattern "{variable_pattern}" is not valid, check grizzly.variable_pattern setting',
@@ -466,8 +723,23 @@ def initialize(ls: GrizzlyLanguageServer, params: lsp.InitializeParams) -> None:
                     )
                     return
 
-            variable_pattern = f'({"|".join(normalized_variable_patterns)})'
-            ls.variable_pattern = re.compile(variable_pattern)
+            # share one leading ".*" between all floating patterns, and try longer alternatives first
+            alternatives = sorted(anchored_variable_patterns, key=lambda pattern: (-len(pattern), pattern))
+            if len(floating_variable_patterns) > 0:
+                floating_alternatives = '|'.join(sorted(floating_variable_patterns, key=lambda pattern: (-len(pattern), pattern)))
+                alternatives.insert(0, f'.*(?:{floating_alternatives})')
+
+            variable_pattern = f'^(?:{"|".join(alternatives)})$'
+            try:
+                ls.variable_pattern = re.compile(variable_pattern)
+            except:
+                ls.logger.exception(
+                    f'variable pattern "{variable_pattern}" is not valid, check grizzly.variable_pattern setting',
+                    notify=True,
+                )
+                return
+
+            ls._variable_pattern_cache[variable_patterns_key] = ls.variable_pattern
         # // -->
 
         # <!-- set file ignore patterns
@@ -497,6 +769,13 @@ def text_document_completion(
 ) -> lsp.CompletionList:
     items: List[lsp.CompletionItem] = []
 
+    if not ls._ready.is_set():
+        ls.logger.debug('inventory is not ready')
+        return lsp.CompletionList(
+            is_incomplete=True,
+            items=items,
+        )
+
     if len(ls.steps.values()) < 1:
         ls.logger.error('no steps in inventory', notify=True)
         return lsp.CompletionList(
@@ -506,11 +785,12 @@ def text_document_completion(
 
     try:
         text_document = ls.workspace.get_text_document(params.text_document.uri)
-        line = get_current_line(text_document, params.position)
+        line = ls.get_current_line(text_document, params.position)
 
         trigger = line[: params.position.character]
 
-        ls.logger.debug(f'{line=}, {params.position=}, {trigger=}')
+        if ls.logger.is_enabled_for(DEBUG):
+            ls.logger.debug(f'{line=}, {params.position=}, {trigger=}')
 
         for trigger_characters, completion_func in [
             ('{{', complete_variable_name),
@@ -520,25 +800,31 @@ def text_document_completion(
                 continue
 
             partial_value = get_trigger(trigger, trigger_characters)
-            ls.logger.debug(f'{trigger_characters=}, {partial_value=}')
+            if ls.logger.is_enabled_for(DEBUG):
+                ls.logger.debug(f'{trigger_characters=}, {partial_value=}')
             if not isinstance(partial_value, bool):
                 items = completion_func(ls, line, text_document, params.position, partial=partial_value)
                 break
 
         if len(items) < 1:
-            if line.strip().startswith('#'):
+            if len(line.strip()) < 1:
+                # nothing typed on the line, only keywords can be suggested
+                items = complete_keyword(ls, None, params.position, text_document)
+            elif line.strip().startswith('#'):
                 items = complete_metadata(line, params.position)
             else:
                 keyword, text = get_step_parts(line)
 
-                if keyword is not None and keyword in ls.keywords:
+                if keyword is not None and keyword in ls.keywords_lookup:
                     base_keyword = ls.get_base_keyword(params.position, text_document)
 
-                    ls.logger.debug(f'{keyword=}, {base_keyword=}, {text=}, {ls.keywords=}')
+                    if ls.logger.is_enabled_for(DEBUG):
+                        ls.logger.debug(f'{keyword=}, {base_keyword=}, {text=}, {ls.keywords=}')
 
                     items = complete_step(ls, keyword, params.position, text, base_keyword=base_keyword)
                 else:
-                    ls.logger.debug(f'{keyword=}, {text=}, {ls.keywords=}')
+                    if ls.logger.is_enabled_for(DEBUG):
+                        ls.logger.debug(f'{keyword=}, {text=}, {ls.keywords=}')
                     items = complete_keyword(ls, keyword, params.position, text_document)
     except:
         ls.logger.exception('failed to complete step expression', notify=True)
@@ -554,18 +840,26 @@ def workspace_did_change_configuration(
     ls: GrizzlyLanguageServer,
     params: lsp.DidChangeConfigurationParams,
 ) -> None:
-    ls.logger.debug(f'{lsp.WORKSPACE_DID_CHANGE_CONFIGURATION}: {params=}')  # pragma: no cover
+    if ls.logger.is_enabled_for(DEBUG):  # pragma: no cover
+        # settings can be large, only log which sections changed
+        settings = params.settings
+        summary = sorted(settings.keys()) if isinstance(settings, dict) else type(settings).__name__
+        ls.logger.debug(f'{lsp.WORKSPACE_DID_CHANGE_CONFIGURATION}: settings={summary}')
 
 
 @server.feature(lsp.TEXT_DOCUMENT_HOVER)
 def text_document_hover(ls: GrizzlyLanguageServer, params: lsp.HoverParams) -> Optional[lsp.Hover]:
+    if not ls._ready.is_set():
+        return None
+
     hover: Optional[lsp.Hover] = None
     help_text: Optional[str] = None
     text_document = ls.workspace.get_text_document(params.text_document.uri)
-    current_line = get_current_line(text_document, params.position)
+    current_line = ls.get_current_line(text_document, params.position)
     keyword, step = get_step_parts(current_line)
 
-    ls.logger.debug(f'{keyword=}, {step=}')
+    if ls.logger.is_enabled_for(DEBUG):
+        ls.logger.debug(f'{keyword=}, {step=}')
 
     abort: bool = False
 
@@ -606,37 +900,37 @@ def text_document_hover(ls: GrizzlyLanguageServer, params: lsp.HoverParams) -> O
 
 @server.feature(lsp.TEXT_DOCUMENT_DID_CHANGE)
 def text_document_did_change(ls: GrizzlyLanguageServer, params: lsp.DidChangeTextDocumentParams) -> None:
+    ls._line_cache.pop(params.text_document.uri, None)
+    ls._diagnostics_cache.pop(params.text_document.uri, None)
     text_document = ls.workspace.get_text_document(params.text_document.uri)
 
-    try:
-        ls.language = find_language(text_document.source)
-    except ValueError:
-        ls.language = 'en'
+    ls.detect_language(text_document, params.content_changes)
 
 
 @server.feature(lsp.TEXT_DOCUMENT_DID_OPEN)
 def text_document_did_open(ls: GrizzlyLanguageServer, params: lsp.DidOpenTextDocumentParams) -> None:
+    ls._line_cache.pop(params.text_document.uri, None)
+    ls._diagnostics_cache.pop(params.text_document.uri, None)
     text_document = ls.workspace.get_text_document(params.text_document.uri)
 
     if text_document.language_id != LANGUAGE_ID:
         return
 
-    try:
-        ls.language = find_language(text_document.source)
-    except ValueError:
-        ls.language = 'en'
+    ls.detect_language(text_document)
 
     # if only validating on save, we should definitely do it now
     if ls.client_settings.get('diagnostics_on_save_only', True):
-        try:
-            diagnostics = validate_gherkin(ls, text_document)
-            ls.publish_diagnostics(text_document.uri, diagnostics)  # type: ignore
-        except:
-            ls.logger.exception('failed to run diagnostics on opened file', notify=True)
+        ls.publish_diagnostics_in_background(text_document)
 
 
 @server.feature(lsp.TEXT_DOCUMENT_DID_CLOSE)
 def text_document_did_close(ls: GrizzlyLanguageServer, params: lsp.DidCloseTextDocumentParams) -> None:
+    ls._line_cache.pop(params.text_document.uri, None)
+    ls._diagnostics_cache.pop(params.text_document.uri, None)
+    ls._language_cache.pop(params.text_document.uri, None)
+    # diagnostics for the document that has not been published yet should not be
+    ls._diagnostics_pending.pop(params.text_document.uri, None)
+
     # always clear diagnostics when file is closed
     try:
         ls.publish_diagnostics(params.text_document.uri, None)  # type: ignore
@@ -653,11 +947,8 @@ def text_document_did_save(ls: GrizzlyLanguageServer, params: lsp.DidSaveTextDoc
 
     # if only validating on save, we should definitely do it now
     if ls.client_settings.get('diagnostics_on_save_only', True):
-        try:
-            diagnostics = validate_gherkin(ls, text_document)
-            ls.publish_diagnostics(text_document.uri, diagnostics)  # type: ignore
-        except:
-            ls.logger.exception('failed to run diagnostics on save', notify=True)
+        # included feature files might have changed
+        ls.publish_diagnostics_in_background(text_document, force=True)
 
 
 @server.feature(lsp.TEXT_DOCUMENT_DEFINITION)
@@ -665,11 +956,15 @@ def text_document_definition(
     ls: GrizzlyLanguageServer,
     params: lsp.DefinitionParams,
 ) -> Optional[List[lsp.LocationLink]]:
+    if not ls._ready.is_set():
+        return None
+
     text_document = ls.workspace.get_text_document(params.text_document.uri)
-    current_line = get_current_line(text_document, params.position)
+    current_line = ls.get_current_line(text_document, params.position)
     definitions: List[lsp.LocationLink] = []
 
-    ls.logger.debug(f'{lsp.TEXT_DOCUMENT_DEFINITION}: {params=}')
+    if ls.logger.is_enabled_for(DEBUG):
+        ls.logger.debug(f'{lsp.TEXT_DOCUMENT_DEFINITION}: uri={params.text_document.uri}, line={params.position.line}, character={params.position.character}')
 
     try:
         file_url_definitions = get_file_url_definition(ls, params, current_line)
@@ -699,10 +994,10 @@ def text_document_diagnostic(
     params: lsp.DocumentDiagnosticParams,
 ) -> lsp.DocumentDiagnosticReport:
     items: List[lsp.Diagnostic] = []
-    if not ls.client_settings.get('diagnostics_on_save_only', True):
+    if ls._ready.is_set() and not ls.client_settings.get('diagnostics_on_save_only', True):
         try:
             text_document = ls.workspace.get_text_document(params.text_document.uri)
-            items = validate_gherkin(ls, text_document)
+            items = ls.get_diagnostics(text_document)
         except:
             ls.logger.exception('failed to run document diagnostics', notify=True)
 
@@ -713,27 +1008,34 @@ def text_document_diagnostic(
 
 
 @server.feature(lsp.WORKSPACE_DIAGNOSTIC)
+@server.thread()
 def workspace_diagnostic(
     ls: GrizzlyLanguageServer,
     params: lsp.WorkspaceDiagnosticParams,
 ) -> lsp.WorkspaceDiagnosticReport:
     report = lsp.WorkspaceDiagnosticReport(items=[])
 
+    if not ls._ready.is_set():
+        return report
+
     try:
-        items: List[lsp.Diagnostic] = []
-        first_text_document = list(ls.workspace.text_documents.keys())[0]
-        text_document = ls.workspace.get_text_document(first_text_document)
-
-        if not ls.client_settings.get('diagnostics_on_save_only', True):
-            items = validate_gherkin(ls, text_document)
-
-        report.items = [
-            lsp.WorkspaceFullDocumentDiagnosticReport(
-                uri=text_document.uri,
-                items=items,
-                kind=lsp.DocumentDiagnosticReportKind.Full,
+        for text_document in list(ls.workspace.text_documents.values()):
+            if text_document.language_id != LANGUAGE_ID:
+                continue
+
+            items: List[lsp.Diagnostic] = []
+
+            if not ls.client_settings.get('diagnostics_on_save_only', True):
+                items = ls.get_diagnostics(text_document)
+
+            report.items.append(
+                lsp.WorkspaceFullDocumentDiagnosticReport(
+                    uri=text_document.uri,
+                    version=text_document.version,
+                    items=items,
+                    kind=lsp.DocumentDiagnosticReportKind.Full,
+                )
             )
-        ]
     except:
         ls.logger.exception('failed to run workspace diagnostics', notify=True)
 
@@ -759,18 +1061,28 @@ def text_document_code_action(
 
 
 @server.command(COMMAND_REBUILD_INVENTORY)
+@server.thread()
 def command_rebuild_inventory(ls: GrizzlyLanguageServer, *args: Any) -> None:
     ls.logger.info(f'executing command: {COMMAND_REBUILD_INVENTORY}')
-    try:
-        sleep(1.0)  # uuhm, some race condition?
-        compile_inventory(ls)
 
-        for text_document in ls.workspace.text_documents.values():
+    # wait for any install (or rebuild) in progress to finish, instead of racing it
+    with ls._rebuild_lock:
+        ls._ready.clear()
+
+        try:
+            compile_inventory(ls)
+        except:
+            ls.logger.exception('failed to rebuild inventory', notify=True)
+            return
+        finally:
+            ls._ready.set()
+
+    try:
+        for text_document in list(ls.workspace.text_documents.values()):
             if text_document.language_id != LANGUAGE_ID:
                 continue
 
-            diagnostics = validate_gherkin(ls, text_document)
-            ls.publish_diagnostics(text_document.uri, diagnostics)  # type: ignore
+            ls.publish_diagnostics_in_background(text_document)
     except:
         ls.logger.exception('failed to rebuild inventory', notify=True)
 
@@ -784,8 +1096,7 @@ def command_run_diagnostics(ls: GrizzlyLanguageServer, *args: Any) -> None:
 
         text_document = ls.workspace.get_text_document(uri)
 
-        diagnostics = validate_gherkin(ls, text_document)
-        ls.publish_diagnostics(text_document.uri, diagnostics)  # type: ignore
+        ls.publish_diagnostics_in_background(text_document, force=True)
     except Exception:
         ls.logger.exception(f'failed to run diagnostics on {uri}', notify=True)
 
@@ -1,36 +1,37 @@
 from __future__ import annotations
 
-from typing import List
+import re
+
 from pathlib import Path
-from contextlib import suppress
+from functools import lru_cache
 
-from jinja2 import Environment
+from jinja2 import Environment, Template
 
 from grizzly_ls.utils import ScenarioTag
 from grizzly_ls.text import remove_if_statements
 
 
-def render_gherkin(path: str, content: str, *, raw: bool = False) -> str:
-    feature_file = Path(path)
-    environment = Environment(autoescape=False, extensions=[ScenarioTag])
-    environment.extend(feature_file=feature_file, ignore_errors=True)
+_COMMENT_LINE = re.compile(r'^[^\S\n]*#.*$', re.MULTILINE)
+_HTML_ENTITIES = str.maketrans({'<': '&lt;', '>': '&gt;'})
+_ENVIRONMENT = Environment(autoescape=False, extensions=[ScenarioTag])
+
+
+@lru_cache(maxsize=32)
+def _get_template(path: str, content: str) -> Template:
+    # compiled template is bound to the environment it was compiled with, so it must be cached per feature file.
+    # included scenarios are read when the template is rendered, so changes in them are still picked up
+    environment = _ENVIRONMENT.overlay()
+    environment.extend(feature_file=Path(path), ignore_errors=True)
 
-    content = remove_if_statements(content)
-    template = environment.from_string(content)
+    return environment.from_string(remove_if_statements(content))
+
+
+def render_gherkin(path: str, content: str, *, raw: bool = False) -> str:
+    template = _get_template(path, content)
     content = template.render()
 
     if not raw:
-        # <!-- sanatize content
-        buffer: List[str] = []
-        for line in content.splitlines():
-            # make any html tag characters in comments are replaced with respective html entity code
-            with suppress(Exception):
-                if line.lstrip()[0] == '#':
-                    line = line.replace('<', '&lt;')
-                    line = line.replace('>', '&gt;')
-
-            buffer.append(line)
-        # // -->
-        return '\n'.join(buffer)
+        # make any html tag characters in comments are replaced with respective html entity code
+        return _COMMENT_LINE.sub(lambda match: match.group(0).translate(_HTML_ENTITIES), content)
 
     return content
@@ -1,15 +1,12 @@
 from __future__ import annotations
 
-import re
-
-from typing import List, Optional, Union, TYPE_CHECKING
+from os import walk
+from typing import List, Optional, Tuple, Union, TYPE_CHECKING
 from pathlib import Path
 from difflib import get_close_matches
 
 from lsprotocol import types as lsp
-from behave.i18n import languages
 from pygls.workspace import TextDocument
-from random_word import RandomWords
 
 from grizzly_ls.constants import (
     MARKER_NO_STEP_IMPL,
@@ -17,29 +14,67 @@ from grizzly_ls.constants import (
     MARKER_LANG_NOT_VALID,
     MARKER_LANG_WRONG_LINE,
 )
-from grizzly_ls.text import get_step_parts, normalize_text
+from grizzly_ls.text import LANGUAGE_NAMES, QUOTED_VALUE, get_step_parts, normalize_text
 
 
 if TYPE_CHECKING:  # pragma: no cover
     from grizzly_ls.server import GrizzlyLanguageServer
 
 
-def quick_fix_no_step_impl(ls: GrizzlyLanguageServer, diagnostic: lsp.Diagnostic, text_document: TextDocument) -> Optional[lsp.CodeAction]:
-    files = sorted(
-        [file for file in ls.root_path.rglob('*.py') if file.name in ['environment.py', 'steps.py']],
-        reverse=True,
-    )
+_QUICK_FIX_FILE_NAMES = frozenset(['environment.py', 'steps.py'])
+_LANGUAGE_CODES = [lang for lang, _, _ in LANGUAGE_NAMES]
 
-    quick_fix_file: Optional[Path] = files[0] if len(files) > 0 else None
 
-    if quick_fix_file is None or not quick_fix_file.exists():
-        return None
+def _get_quick_fix_file(ls: GrizzlyLanguageServer) -> Optional[Tuple[Path, str]]:
+    cached = ls._quick_fix_file_cache.get(ls.root_path, None)
+
+    # cached file might have been removed since it was found
+    if cached is None or not cached[0].exists():
+        # only create paths for the files we are looking for, not for every python file in the project
+        files = [Path(root) / name for root, _, filenames in walk(ls.root_path) for name in _QUICK_FIX_FILE_NAMES.intersection(filenames)]
+
+        # (lexicographically) greatest path, no need to sort all of them
+        quick_fix_file = max(files, default=None)
+
+        if quick_fix_file is None:
+            return None
+
+        # uri is the same for all quick fixes, no need to encode it every time
+        cached = (quick_fix_file, quick_fix_file.as_uri())
+        ls._quick_fix_file_cache[ls.root_path] = cached
+
+    return cached
+
+
+def _get_line_count(ls: GrizzlyLanguageServer, path: Path) -> int:
+    modified = path.stat().st_mtime_ns
+    cached = ls._line_count_cache.get(path, None)
+
+    if cached is not None and cached[0] == modified:
+        return cached[1]
 
+    # no need to decode the file, just count the lines
+    with path.open('rb') as fd:
+        line_count = sum(1 for _ in fd)
+
+    ls._line_count_cache[path] = (modified, line_count)
+
+    return line_count
+
+
+def quick_fix_no_step_impl(ls: GrizzlyLanguageServer, diagnostic: lsp.Diagnostic, text_document: TextDocument) -> Optional[lsp.CodeAction]:
     step_impl_template = ls.client_settings.get('quick_fix', {}).get('step_impl_template', None)
 
     if step_impl_template is None:
         return None
 
+    quick_fix_target = _get_quick_fix_file(ls)
+
+    if quick_fix_target is None:
+        return None
+
+    quick_fix_file, quick_fix_uri = quick_fix_target
+
     _, message_expression = diagnostic.message.split('\n', 1)
     keyword, expression = get_step_parts(message_expression)
     if keyword is None or expression is None:
@@ -50,22 +85,23 @@ def quick_fix_no_step_impl(ls: GrizzlyLanguageServer, diagnostic: lsp.Diagnostic
 
         keyword_key = ls.get_language_key(base_keyword)
 
-        variable_matches = list(re.finditer(r'"([^"]*)"', expression or '', flags=re.MULTILINE))
+        variable_matches = list(QUOTED_VALUE.finditer(expression or ''))
 
         if variable_matches:
-            generator = RandomWords()
-            args: List[str] = []
-            offset = 0
-            for variable_match in variable_matches:
+            variable_names: List[str] = []
+            for index, variable_match in enumerate(variable_matches, start=1):
                 variable_name = normalize_text(variable_match.group(1)).lower()
+                # placeholder name, based on the position of the argument, for the user to rename
                 if not variable_name.isidentifier():
-                    variable_name = generator.get_random_word().lower()
+                    variable_name = f'arg{index}'
 
-                expression = f'{expression[0:variable_match.start() + offset]}"{{{variable_name}}}"{expression[variable_match.end() + offset:]}'
-                offset += abs(len(variable_match.group(1)) - len(variable_name)) + 2  # we're also adding { and }
-                args.append(f'{variable_name}: str')
+                variable_names.append(variable_name)
 
-            arguments = f', {", ".join(args)}'
+            # replace all quoted values with their variable name in one pass
+            replacements = iter(variable_names)
+            expression = QUOTED_VALUE.sub(lambda _: f'"{{{next(replacements)}}}"', expression)
+
+            arguments = f', {", ".join(f"{variable_name}: str" for variable_name in variable_names)}'
         else:
             arguments = ''
 
@@ -78,15 +114,14 @@ def step_impl(context: Context{arguments}) -> None:
             arguments=arguments,
         )
 
-        target_source = quick_fix_file.read_text().splitlines()
-        position = lsp.Position(line=len(target_source), character=0)
+        position = lsp.Position(line=_get_line_count(ls, quick_fix_file), character=0)
 
         return lsp.CodeAction(
             title='Create step implementation',
             kind=lsp.CodeActionKind.QuickFix,
             edit=lsp.WorkspaceEdit(
                 changes={
-                    quick_fix_file.as_uri(): [
+                    quick_fix_uri: [
                         lsp.TextEdit(
                             range=lsp.Range(
                                 start=position,
@@ -123,15 +158,14 @@ def quick_fix_lang_not_valid(text_document: TextDocument, diagnostic: lsp.Diagno
     _, language, _ = diagnostic.message.split('"', 2)
 
     # check if typed language is a long version
-    for lang, localization in languages.items():
-        if language.lower() in localization.get('name', ['___12341234__asdf'])[0].lower() or language.lower() in localization.get('native', ['___12341234_asdf'])[0].lower():
+    language_lower = language.lower()
+    for lang, name, native in LANGUAGE_NAMES:
+        if language_lower in name or language_lower in native:
             actions.append(_code_action_lang_not_valid(lang, text_document.uri, diagnostic.range))
 
     # check if typed language has any close matches to available languages
     if len(actions) < 1:
-        langs = list(languages.keys())
-
-        possible_langs = get_close_matches(language, langs, len(langs), 0.5)
+        possible_langs = get_close_matches(language, _LANGUAGE_CODES, len(_LANGUAGE_CODES), 0.5)
 
         for possible_lang in possible_langs:
             actions.append(_code_action_lang_not_valid(possible_lang, text_document.uri, diagnostic.range))
@@ -148,10 +182,9 @@ def quick_fix_lang_wrong_line(text_document: TextDocument, diagnostic: lsp.Diagn
         source_lines = text_document.source.splitlines()
         end_line = len(source_lines) - 1
         end_character = len(source_lines[-1]) - 1
-        new_text = source_lines.pop(diagnostic.range.start.line)
-        source = '\n'.join(source_lines)
-
-        new_text = f'{new_text}\n{source}'
+        # move the line first and join once, instead of joining the rest of the document and then prepending the line
+        source_lines.insert(0, source_lines.pop(diagnostic.range.start.line))
+        new_text = '\n'.join(source_lines)
 
         range = lsp.Range(
             start=lsp.Position(line=0, character=0),
@@ -6,13 +6,11 @@ import re
 
 from typing import Optional, List, Set, Dict, Union, TYPE_CHECKING
 from tokenize import NAME, OP
-from difflib import get_close_matches
 
 from lsprotocol import types as lsp
 from pygls.workspace import TextDocument
-from behave.i18n import languages
 
-from grizzly_ls.text import get_tokens
+from grizzly_ls.text import LANGUAGE_NAMES, QUOTED_VALUE, get_tokens, get_expression_shell
 from grizzly_ls.constants import MARKER_LANGUAGE
 
 
@@ -22,6 +20,8 @@ if TYPE_CHECKING:  # pragma: no cover
 
 logger = logging.getLogger(__name__)
 
+_EMPTY_ARGUMENT = re.compile(r'""')
+
 
 def get_trigger(value: str, trigger: str) -> Union[bool, Optional[str]]:
     partial_value: Optional[str] = None
@@ -52,10 +52,10 @@ def complete_metadata(
         _, expression = line.strip().split(MARKER_LANGUAGE, 1)
         expression = expression.strip()
 
-        for lang, localization in languages.items():
-            name = localization.get('name', ['___12341234_asdf'])[0]
-            native = localization.get('native', ['___12341234_asdf'])[0]
-            if not (expression.lower() in name.lower() or expression.lower() in native.lower() or expression.lower() in lang) and len(expression.strip()) > 0:
+        expression_lower = expression.lower()
+
+        for lang, name, native in LANGUAGE_NAMES:
+            if len(expression_lower) > 0 and not (expression_lower in name or expression_lower in native or expression_lower in lang):
                 continue
 
             text_edit = lsp.TextEdit(
@@ -110,14 +110,13 @@ def complete_keyword(
             *ls.localizations.get('scenario_outline', []),
         ]
 
-        if not any([scenario_keyword in text_document.source for scenario_keyword in scenario_keywords]):
+        if ls.keywords_scenario_pattern.search(text_document.source) is None:
             keywords = scenario_keywords
         else:
             keywords = ls.keywords.copy()
 
-        for keyword_once in ls.keywords_once:
-            if f'{keyword_once}:' not in text_document.source:
-                keywords.append(keyword_once)
+        keywords_once_used = set(ls.keywords_once_pattern.findall(text_document.source))
+        keywords.extend([keyword_once for keyword_once in ls.keywords_once if keyword_once not in keywords_once_used])
 
         # check for partial matches
         if keyword is not None:
@@ -201,20 +200,24 @@ def complete_variable_name(
 ) -> List[lsp.CompletionItem]:
     items: List[lsp.CompletionItem] = []
 
-    ls.logger.debug(f'{line=}, {position=}, {partial=}')
+    if ls.logger.is_enabled_for(logging.DEBUG):
+        ls.logger.debug(f'{line=}, {position=}, {partial=}')
 
     # find `Scenario:` before current position
-    lines = text_document.source.splitlines()
-    before_lines = reversed(lines[0 : position.line])
+    lines = ls.get_lines(text_document)
+    scenario_keywords = ls.localizations.get('scenario', [])
 
-    for before_line in before_lines:
+    # walk upwards from the line before the current, without copying the lines
+    for lineno in range(min(position.line, len(lines)) - 1, -1, -1):
+        before_line = lines[lineno].rstrip('\r')
         if len(before_line.strip()) < 1:
             continue
 
         match = ls.variable_pattern.match(before_line)
 
         if match:
-            variable_name = match.group(2) or match.group(3)
+            # each alternative in the pattern has one group, the one that matched has the variable name
+            variable_name = next((group for group in match.groups() if group is not None), None)
 
             if variable_name is None or (partial is not None and not variable_name.startswith(partial)):
                 continue
@@ -244,7 +247,8 @@ def complete_variable_name(
                 new_text=new_text,
             )
 
-            logger.debug(f'{line=}, {variable_name=}, {partial=}, {text_edit=}')
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f'{line=}, {variable_name=}, {partial=}, {text_edit=}')
 
             items.append(
                 lsp.CompletionItem(
@@ -254,7 +258,7 @@ def complete_variable_name(
                     text_edit=text_edit,
                 )
             )
-        elif any([scenario_keyword in before_line for scenario_keyword in ls.localizations.get('scenario', [])]):
+        elif any(scenario_keyword in before_line for scenario_keyword in scenario_keywords):
             break
 
     return items
@@ -270,43 +274,47 @@ def complete_step(
 ) -> List[lsp.CompletionItem]:
     # only suggest step expression related to the specific base keyword
     key = ls.get_language_key(base_keyword)
-    steps = [step.expression for step in ls.steps.get(key, []) + ls.steps.get('step', [])]
+    keys = (key,) if key == 'step' else (key, 'step')
+    step_index = ls.step_index
 
-    matched_steps: List[lsp.CompletionItem] = []
     matched_steps_1: Set[str]
     matched_steps_2: Set[str] = set()
     matched_steps_3: Set[str] = set()
 
     if expression is None or len(expression) < 1:
-        matched_steps_1 = set(steps)
+        matched_steps_1 = set(step_index.find_keywords_expressions(keys))
     else:
         # remove any user values enclosed with double-quotes
-        expression_shell = re.sub(r'"[^"]*"', '""', expression)
+        expression_shell = get_expression_shell(expression)
 
-        # 1. exact matching
-        matched_steps_1: Set[str] = set(filter(lambda s: s.startswith(expression_shell), steps))  # type: ignore
+        # 1. exact matching, expressions are sorted so the ones that starts with the expression are found with a binary search
+        matched_steps_1 = set(itertools.chain.from_iterable([step_index.find_prefix_expressions(step_key, expression_shell) for step_key in keys]))
 
         if len(matched_steps_1) < 1 or ' ' not in expression:
             # 2. close enough matching
-            matched_steps_2 = set(filter(lambda s: expression_shell in s, steps))  # type: ignore
+            matched_steps_2 = set(step_index.find_containing_expressions(keys, expression_shell))
 
             # 3. "fuzzy" matching
-            matched_steps_3 = set(get_close_matches(expression_shell, steps, len(steps), 0.6))
+            matched_steps_3 = set(step_index.find_close_expressions(keys, expression_shell))
 
     # keep order so that 1. matches comes before 2. matches etc.
     matched_steps_container: Dict[str, lsp.CompletionItem] = {}
 
-    input_matches = list(re.finditer(r'"([^"]*)"', expression or '', flags=re.MULTILINE))
+    input_values = [input_match.group(1) for input_match in QUOTED_VALUE.finditer(expression or '')]
+
+    # a step can be matched by more than one of the strategies, only handle it the first time
+    seen_steps: Set[str] = set()
 
     for matched_step in itertools.chain(matched_steps_1, matched_steps_2, matched_steps_3):
-        output_matches = list(re.finditer(r'"([^"]*)"', matched_step, flags=re.MULTILINE))
+        if matched_step in seen_steps:
+            continue
+
+        seen_steps.add(matched_step)
 
         # suggest step with already entetered variables in their correct place
-        if input_matches and output_matches:
-            offset = 0
-            for input_match, output_match in zip(input_matches, output_matches):
-                matched_step = f'{matched_step[0:output_match.start() + offset]}"{input_match.group(1)}"{matched_step[output_match.end() + offset:]}'
-                offset += len(input_match.group(1))
+        if input_values:
+            replacements = iter(input_values)
+            matched_step = QUOTED_VALUE.sub(lambda _: f'"{next(replacements)}"', matched_step, count=len(input_values))
 
         start = lsp.Position(line=position.line, character=position.character)
         preselect: bool = False
@@ -334,20 +342,12 @@ def complete_step(
         if expression is not None and len(expression.strip()) > 0 and expression[-1] == ' ' and expression[-2] != ' ' and new_text[0] == ' ':
             new_text = new_text[1:]
 
-        logger.debug(f'{expression=}, {new_text=}, {matched_step=}')
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f'{expression=}, {new_text=}, {matched_step=}')
 
         if '""' in new_text:
-            snippet_matches = re.finditer(
-                r'""',
-                new_text,
-                flags=re.MULTILINE,
-            )
-
-            offset = 0
-            for index, snippet_match in enumerate(snippet_matches, start=1):
-                snippet_placeholder = f'${index}'
-                new_text = f'{new_text[0:snippet_match.start() + offset]}"{snippet_placeholder}"{new_text[snippet_match.end() + offset:]}'
-                offset += len(snippet_placeholder)
+            placeholders = itertools.count(1)
+            new_text = _EMPTY_ARGUMENT.sub(lambda _: f'"${next(placeholders)}"', new_text)
 
             insert_text_format = lsp.InsertTextFormat.Snippet
         else:
@@ -358,20 +358,14 @@ def complete_step(
             new_text=new_text,
         )
 
-        matched_steps_container.update(
-            {
-                matched_step: lsp.CompletionItem(
-                    label=matched_step,
-                    kind=lsp.CompletionItemKind.Function,
-                    documentation=ls._find_help(f'{keyword} {matched_step}'),
-                    deprecated=False,
-                    preselect=preselect,
-                    insert_text_format=insert_text_format,
-                    text_edit=text_edit,
-                )
-            }
-        )  # type: ignore
-
-        matched_steps = list(matched_steps_container.values())
+        matched_steps_container[matched_step] = lsp.CompletionItem(
+            label=matched_step,
+            kind=lsp.CompletionItemKind.Function,
+            documentation=ls._find_help(f'{keyword} {matched_step}'),
+            deprecated=False,
+            preselect=preselect,
+            insert_text_format=insert_text_format,
+            text_edit=text_edit,
+        )
 
-    return matched_steps
+    return list(matched_steps_container.values())
@@ -1,69 +1,70 @@
 from __future__ import annotations
 
+import os
 import sys
-import re
 import inspect
 
-from typing import Optional, List, TYPE_CHECKING
+from typing import Any, Callable, Optional, List, Tuple, TYPE_CHECKING
 from pathlib import Path
-from urllib.parse import urlparse
+from functools import lru_cache
 
 from lsprotocol import types as lsp
 
-from grizzly_ls.text import get_step_parts
+from grizzly_ls.text import QUOTED_VALUE, get_step_parts, get_expression_shell
 
 
 if TYPE_CHECKING:  # pragma: no cover
     from grizzly_ls.server import GrizzlyLanguageServer
 
 
-def get_step_definition(ls: GrizzlyLanguageServer, params: lsp.DefinitionParams, current_line: str) -> Optional[lsp.LocationLink]:
-    step_definition: Optional[lsp.LocationLink] = None
+@lru_cache(maxsize=4096)
+def _get_step_location(step_func: Callable[..., Any]) -> Tuple[str, int]:
+    # reading and tokenizing the source file only has to be done once per step function, functions are recreated when the inventory is rebuilt
+    file_location = inspect.getfile(step_func)
+    _, lineno = inspect.getsourcelines(step_func)
+
+    return Path(file_location).resolve().as_uri(), lineno
+
 
+def get_step_definition(ls: GrizzlyLanguageServer, params: lsp.DefinitionParams, current_line: str) -> Optional[lsp.LocationLink]:
     keyword, expression = get_step_parts(current_line)
 
     if keyword is None or expression is None:
         return None
 
-    expression = re.sub(r'"[^"]*"', '""', expression)
-    for steps in ls.steps.values():
-        for step in steps:
-            if step.expression != expression:
-                continue
+    step = ls.step_index.expression_steps.get(get_expression_shell(expression), None)
 
-            # support projects that wraps the behave step decorators
-            step_func = getattr(step.func, '__wrapped__', step.func)
+    if step is None:
+        return None
 
-            if isinstance(step_func, staticmethod):
-                step_func = step_func.__func__
+    # support projects that wraps the behave step decorators
+    step_func = getattr(step.func, '__wrapped__', step.func)
 
-            file_location = inspect.getfile(step_func)
-            _, lineno = inspect.getsourcelines(step_func)
+    if isinstance(step_func, staticmethod):
+        step_func = step_func.__func__
 
-            range = lsp.Range(
-                start=lsp.Position(line=lineno, character=0),
-                end=lsp.Position(line=lineno, character=0),
-            )
-            step_definition = lsp.LocationLink(
-                target_uri=Path(file_location).resolve().as_uri(),
-                target_range=range,
-                target_selection_range=range,
-                origin_selection_range=lsp.Range(
-                    start=lsp.Position(
-                        line=params.position.line,
-                        character=(len(current_line) - len(current_line.lstrip())),
-                    ),
-                    end=lsp.Position(
-                        line=params.position.line,
-                        character=len(current_line),
-                    ),
-                ),
-            )
+    target_uri, lineno = _get_step_location(step_func)
 
-            # we have found what we are looking for
-            break
+    range = lsp.Range(
+        start=lsp.Position(line=lineno, character=0),
+        end=lsp.Position(line=lineno, character=0),
+    )
 
-    return step_definition
+    return lsp.LocationLink(
+        target_uri=target_uri,
+        target_range=range,
+        target_selection_range=range,
+        origin_selection_range=lsp.Range(
+            start=lsp.Position(
+                line=params.position.line,
+                character=(len(current_line) - len(current_line.lstrip())),
+            ),
+            end=lsp.Position(
+                line=params.position.line,
+                character=len(current_line),
+            ),
+        ),
+    )
 
 
 def get_file_url_definition(
@@ -71,60 +72,71 @@ def get_file_url_definition(
     params: lsp.DefinitionParams,
     current_line: str,
 ) -> List[lsp.LocationLink]:
+    # file references are always quoted, nothing to link otherwise
+    if '"' not in current_line:
+        return []
+
     text_document = ls.workspace.get_text_document(params.text_document.uri)
     document_directory = Path(text_document.path).parent
     definitions: List[lsp.LocationLink] = []
-    matches = re.finditer(r'"([^"]*)"', current_line, re.MULTILINE)
+    matches = QUOTED_VALUE.finditer(current_line)
 
     stripped_line = current_line.strip()
-    is_expression = stripped_line[:2] == '{%' and stripped_line[-2:] == '%}'
+    is_expression = stripped_line.startswith('{%') and stripped_line.endswith('%}')
 
     line_variables: List[str] = []
 
     for variable_match in matches:
         variable_value = variable_match.group(1)
 
+        # a link is always within the value, skip values the cursor is not in before doing any file system work
+        if not (variable_match.start(1) <= params.position.character <= variable_match.end(1)):
+            # arguments before the feature file are still needed, to find the scenario
+            if is_expression and 'file://' not in variable_value:
+                line_variables.append(variable_value)
+
+            continue
+
         target_line = 0
         target_char_start = 0
         target_char_end = 0
+        payload_exists: Optional[bool] = None
 
-        if 'file://' in variable_value:
-            file_match = re.search(r'.*(file:\/\/)([^\$]*)', variable_value)
-            if not file_match:
-                continue
+        file_url_start = variable_value.rfind('file://')
 
-            file_url = f'{file_match.group(1)}{file_match.group(2)}'
+        if file_url_start > -1:
+            # file url ends at the first $, if any
+            file_url = variable_value[file_url_start:].split('$', 1)[0]
 
             if sys.platform == 'win32':  # pragma: no cover
                 file_url = file_url.replace('\\', '/')
-                file_url = file_url.replace('file:///', 'file://')
+                # url always starts with file://, no need to search the whole string
+                if file_url.startswith('file:///'):
+                    file_url = f'file://{file_url[8:]}'
 
-            file_parsed = urlparse(file_url)
+            # only netloc and path is needed, no need for a full urlparse
+            netloc, separator, path = file_url[len('file://') :].partition('/')
 
             # relative or absolute?
-            if file_parsed.netloc == '.':  # relative!
-                relative_path = file_parsed.path
-                if relative_path.startswith('/'):
-                    relative_path = relative_path[1:]
-
-                payload_file = document_directory / relative_path
+            if netloc == '.':  # relative!
+                payload_file = document_directory / path
             else:  # absolute!
-                payload_file = Path(f'{file_parsed.netloc}{file_parsed.path}')
+                payload_file = Path(f'{netloc}{separator}{path}')
 
-            start_offset = file_match.start(1)
+            start_offset = file_url_start
             end_offset = -1 if variable_value.endswith('$') else 0
         else:
             # this is quite grizzly specific...
             if is_expression:
-                base_path = Path(text_document.path).parent
                 variable_path = Path(variable_value)
                 if variable_path.is_absolute():
                     payload_file = variable_path.resolve()
                 else:
-                    payload_file = (base_path / variable_path).resolve()
+                    payload_file = (document_directory / variable_path).resolve()
 
                 # scenario name is the argument before the feature file
-                if len(line_variables) == 1 and payload_file.exists():
+                payload_exists = os.path.exists(payload_file)
+                if len(line_variables) == 1 and payload_exists:
                     scenario_name = line_variables[0]
 
                     payload_text = payload_file.read_text()
@@ -139,13 +151,16 @@ def get_file_url_definition(
 
                 line_variables.append(variable_value)
             else:
-                payload_file = ls.root_path / 'features' / 'requests' / variable_value
+                payload_file = ls.requests_path / variable_value
 
             start_offset = 0
             end_offset = 0
 
-        # just some text
-        if not payload_file.exists():
+        # just some text, stat the file only once per value
+        if payload_exists is None:
+            payload_exists = os.path.exists(payload_file)
+
+        if not payload_exists:
             continue
 
         start = variable_match.start(1) + start_offset
@@ -8,6 +8,7 @@ from io import BytesIO
 from pathlib import Path
 from dataclasses import dataclass
 from contextlib import suppress
+from functools import lru_cache
 
 from pygls.workspace import TextDocument
 from lsprotocol import types as lsp
@@ -22,14 +23,22 @@ from grizzly_ls.constants import (
     MARKER_LANG_NOT_VALID,
     MARKER_LANG_WRONG_LINE,
 )
-from grizzly_ls.text import get_step_parts
+from grizzly_ls.text import get_step_parts, find_language_header
 from grizzly_ls.utils import ScenarioTag, MissingScenario
+from grizzly_ls.server.inventory import get_language_keywords
 
 
 if TYPE_CHECKING:  # pragma: no cover
     from grizzly_ls.server import GrizzlyLanguageServer
 
 
+_PARSE_ERROR_PREFIX = re.compile(r'Failed to parse ("[^"]*"|\<string\>):')
+_AT_LINE = re.compile(r'.*at line ([0-9]+).*', re.MULTILINE)
+_QUOTED_LINE_TEXT = re.compile(r': "([^"]*)"', re.MULTILINE)
+_VARIABLE_REFERENCE = re.compile(r'\{\$ ([^\$]+) \$\}')
+_SCENARIO_TAG_LINE = re.compile(r'^[^\S\n]*\{%.*(?:\n|$)', re.MULTILINE)
+
+
 @dataclass
 class ArgumentPosition:
     value: str
@@ -61,27 +70,27 @@ def _get_message_from_parse_error(error: ParserError, *, line_map: Optional[Dict
     message = str(error)
 
     # Remove static strings composed by ParserError.__str__
-    message = re.sub(r'Failed to parse ("[^"]*"|\<string\>):', '', message).strip()
+    message = _PARSE_ERROR_PREFIX.sub('', message).strip()
 
     # remove line_text from message
     if error.line_text is not None:
         message = message.replace(f': "{error.line_text}"', '').strip()
 
-    match = re.search(r'.*at line ([0-9]+).*', message, flags=re.MULTILINE)
+    match = _AT_LINE.search(message)
     if match:
         lineno = int(match.group(1))
-        message = re.sub(rf',? at line {lineno}', '', message, flags=re.MULTILINE).strip()
+        message = message.replace(f', at line {lineno}', '').replace(f' at line {lineno}', '').strip()
 
         if error.line is None:
             error.line = lineno - 1
 
     if error.line_text is None:
         if '{%' not in message and '%}' not in message:
-            match = re.search(r': "([^"]*)"', message, flags=re.MULTILINE)
+            match = _QUOTED_LINE_TEXT.search(message)
             if match:
                 error.line_text = match.group(1)
 
-                message = re.sub(rf': "{error.line_text}"', '', message, flags=re.MULTILINE).strip()
+                message = message.replace(f': "{error.line_text}"', '').strip()
         else:
             message, _ = message.split(':', 1)
 
@@ -97,25 +106,25 @@ def _get_message_from_parse_error(error: ParserError, *, line_map: Optional[Dict
 def _remove_scenario_tags(source: str) -> str:
     # remove any expressions from source, since they messes up behave
     # feature parsing
-    original_source = source
-    if '{%' in original_source:
-        buffer: List[str] = []
-        for original_line in original_source.splitlines():
-            stripped_line = original_line.lstrip()
-            if stripped_line.startswith('{%'):
-                continue
-            buffer.append(original_line)
+    if '{%' not in source:
+        return source
+
+    return _SCENARIO_TAG_LINE.sub('', source)
+
 
-        source = '\n'.join(buffer)
-    else:
-        source = original_source
+@lru_cache(maxsize=128)
+def _parse_included_feature(path: str, content: str) -> Optional[Feature]:
+    # content is part of the key, so changes in the included feature file are picked up
+    return parse_feature(_remove_scenario_tags(content), language=None, filename=path)
 
-    return source
+
+@lru_cache(maxsize=128)
+def _get_included_scenario_text(path: str, content: str, scenario: str) -> str:
+    return ScenarioTag.get_scenario_text(scenario, Path(path), content)
 
 
 def validate_gherkin(ls: GrizzlyLanguageServer, text_document: TextDocument) -> List[lsp.Diagnostic]:
     diagnostics: OrderedSet[GrizzlyDiagnostic] = OrderedSet(set())
-    line_map: Dict[str, str] = {}
     included_feature_files: Dict[str, Feature] = {}
 
     ignoring: bool = False
@@ -124,6 +133,12 @@ def validate_gherkin(ls: GrizzlyLanguageServer, text_document: TextDocument) ->
 
     lines = text_document.source.splitlines()
 
+    # validation can run in another thread, use keywords of the document language instead of the current language of the server
+    try:
+        language_keywords = get_language_keywords(find_language_header(text_document.source)[0])
+    except ValueError:
+        language_keywords = get_language_keywords('en')
+
     if text_document.source.count('"""') % 2 != 0:
         for lineno, line in enumerate(reversed(lines)):
             stripped_line = line.strip()
@@ -157,7 +172,7 @@ def validate_gherkin(ls: GrizzlyLanguageServer, text_document: TextDocument) ->
             continue
 
         # ignore any lines that comes between free text, or empty lines, or lines that could be a table
-        if stripped_line[:3] == '"""':
+        if stripped_line.startswith('"""'):
             ignoring = not ignoring
             continue
 
@@ -165,7 +180,6 @@ def validate_gherkin(ls: GrizzlyLanguageServer, text_document: TextDocument) ->
             continue
 
         position = len(line) - len(stripped_line)
-        line_map.update({stripped_line: line})
 
         # validate language
         if stripped_line.startswith(MARKER_LANGUAGE):
@@ -209,7 +223,7 @@ def validate_gherkin(ls: GrizzlyLanguageServer, text_document: TextDocument) ->
             continue
 
         # handle jinja2 expressions
-        if stripped_line[:2] == '{%' and stripped_line[-2:] == '%}':
+        if stripped_line.startswith('{%') and stripped_line.endswith('%}'):
             # only tokenize the actual jinja2 expression, not the markers
             try:
                 tokens = list(tokenize(BytesIO(stripped_line[2:-2].strip().encode()).readline))
@@ -260,7 +274,7 @@ def validate_gherkin(ls: GrizzlyLanguageServer, text_document: TextDocument) ->
 
                     variable_name = token.string
                     variable_value = value_token.string.strip('"\'')
-                    offset = len(line) - len(stripped_line) + 3
+                    offset = position + 3
                     arg_variables.append(
                         (
                             ArgumentPosition(variable_name, start=token.start[1] + offset, end=token.end[1] + offset),
@@ -329,12 +343,8 @@ def validate_gherkin(ls: GrizzlyLanguageServer, text_document: TextDocument) ->
                     continue
 
                 try:
-                    source = _remove_scenario_tags(feature_file.read_text(encoding='utf-8'))
-                    feature = parse_feature(
-                        source,
-                        language=None,
-                        filename=feature_file.as_posix(),
-                    )
+                    feature_content = feature_file.read_text(encoding='utf-8')
+                    feature = _parse_included_feature(feature_file.as_posix(), feature_content)
                     ls.logger.debug(f'included feature: {feature_file.as_uri()}#{arg_scenario.value}')
 
                     # it was possible to parse the feature file, but it didn't contain any scenarios
@@ -358,23 +368,24 @@ def validate_gherkin(ls: GrizzlyLanguageServer, text_document: TextDocument) ->
                         )
                         continue
 
-                    source = ScenarioTag.get_scenario_text(arg_scenario.value, feature_file)
+                    source = _get_included_scenario_text(feature_file.as_posix(), feature_content, arg_scenario.value)
+
+                    # find all variables used in the scenario, and if they are used in anything else than comments
+                    used_variables: Dict[str, bool] = {}
+                    for source_line in source.splitlines():
+                        if '{$' not in source_line:
+                            continue
+
+                        is_comment = source_line.lstrip().startswith('#')
+                        for variable_name in _VARIABLE_REFERENCE.findall(source_line):
+                            used_variables[variable_name] = used_variables.get(variable_name, False) or not is_comment
 
                     # check if declared variables is used
                     declared_variables: Set[str] = set()
                     for arg_variable_name, arg_variable_value in arg_variables:
-                        variable_template = f'\\{{\\$ {arg_variable_name.value} \\$\\}}'
-                        matches = re.finditer(rf'^\s?.*{variable_template}.*$', source, re.MULTILINE)
-                        found_variable = False
                         declared_variables.add(arg_variable_name.value)
 
-                        for match in matches:
-                            if match.group(0).strip()[0] == '#':
-                                continue
-
-                            found_variable = True
-
-                        if not found_variable:
+                        if not used_variables.get(arg_variable_name.value, False):
                             ls.logger.debug(f'{arg_variable_name=}, {arg_variable_value=}, {arg_variable_name.start=}, {arg_variable_value.end=}')
                             diagnostics.add(
                                 GrizzlyDiagnostic(
@@ -389,30 +400,24 @@ def validate_gherkin(ls: GrizzlyLanguageServer, text_document: TextDocument) ->
                             )
 
                     # check if variables used has been declared
-                    matches = re.finditer(r'^\s?.*\{\$ ([^\$]+) \$\}.*$', source, re.MULTILINE)
-                    for match in matches:
-                        variable_name = match.group(1)
-                        variable_template = f'{{$ {variable_name} $}}'
+                    for variable_name in used_variables:
                         if variable_name not in declared_variables:
-                            start, end = match.span(0)
-                            start = len(line) - len(stripped_line)
-                            end = len(line)
-
                             diagnostics.add(
                                 GrizzlyDiagnostic(
                                     range=lsp.Range(
-                                        start=lsp.Position(line=lineno, character=start),
-                                        end=lsp.Position(line=lineno, character=end),
+                                        start=lsp.Position(line=lineno, character=position),
+                                        end=lsp.Position(line=lineno, character=len(line)),
                                     ),
                                     message=f'Scenario tag is missing variable "{variable_name}"',
                                     severity=lsp.DiagnosticSeverity.Warning,
                                     source=ls.__class__.__name__,
                                 )
                             )
+
                     included_feature_files.update({arg_feature.value: feature})
                 except ParserError as pe:
                     character, message = _get_message_from_parse_error(pe)
-                    character = character or (len(line) - len(stripped_line))
+                    character = character or position
 
                     diagnostics.add(
                         GrizzlyDiagnostic(
@@ -525,12 +530,11 @@ def validate_gherkin(ls: GrizzlyLanguageServer, text_document: TextDocument) ->
             if keyword is not None:
                 start_position = lsp.Position(line=lineno, character=position)
                 keyword = keyword.rstrip(' :')
-                base_keyword = ls.get_base_keyword(start_position, text_document)
+                base_keyword = ls.get_base_keyword(start_position, text_document, language_keywords)
+                lang_key = language_keywords.keyword_to_key.get(base_keyword, None)
 
-                try:
-                    lang_key = ls.get_language_key(base_keyword)
-                except ValueError:
-                    name = ls.localizations.get('name', ['unknown'])[0]
+                if lang_key is None:
+                    name = language_keywords.localizations.get('name', ['unknown'])[0]
 
                     diagnostics.add(
                         GrizzlyDiagnostic(
@@ -545,21 +549,8 @@ def validate_gherkin(ls: GrizzlyLanguageServer, text_document: TextDocument) ->
                     )
 
             # check if step expression exists
-            if lang_key is not None and expression is not None and keyword not in ls.keywords_headers:
-                found_step = False
-                expression_shell = re.sub(r'"[^"]*"', '""', expression)
-
-                for steps in ls.steps.values():
-                    for step in steps:
-                        # some step expressions might have enum values pre-filled,
-                        # clean them out first
-                        step_expression = re.sub(r'"[^"]*"', '""', step.expression)
-
-                        if step_expression == expression_shell:
-                            found_step = True
-                            break
-
-                if not found_step:
+            if lang_key is not None and expression is not None and keyword not in language_keywords.keywords_headers:
+                if not ls.step_index.has_expression_shell(expression):
                     diagnostics.add(
                         GrizzlyDiagnostic(
                             range=lsp.Range(
@@ -580,6 +571,8 @@ def validate_gherkin(ls: GrizzlyLanguageServer, text_document: TextDocument) ->
 
         parse_feature(source, language=language, filename=text_document.filename)
     except ParserError as pe:
+        # map with un-stripped lines, only needed when the document could not be parsed
+        line_map = {line.strip(): line for line in lines}
         character, message = _get_message_from_parse_error(pe, line_map=line_map)
         diagnostics.add(
             GrizzlyDiagnostic(
@@ -598,8 +591,4 @@ def validate_gherkin(ls: GrizzlyLanguageServer, text_document: TextDocument) ->
     except KeyError:
         pass
 
-    # clean up
-    line_map.clear()
-    included_feature_files.clear()
-
     return list(diagnostics)
@@ -3,13 +3,19 @@ from __future__ import annotations
 import warnings
 import inspect
 import re
+import sys
+import itertools
 
 from os import sep
-from typing import Any, Iterable, List, Dict, Optional, TYPE_CHECKING, Set, cast
+from bisect import bisect_left
+from difflib import get_close_matches
+from typing import Any, Iterable, List, Dict, FrozenSet, Optional, TYPE_CHECKING, Set, Tuple, cast
 from types import ModuleType
 from importlib import import_module
 from pathlib import Path, PurePath
 from contextlib import suppress
+from dataclasses import dataclass
+from functools import lru_cache
 
 from behave.matchers import ParseMatcher
 from behave.runner_util import load_step_modules as behave_load_step_modules
@@ -21,17 +27,176 @@ from grizzly_ls.text import (
     Coordinate,
     RegexPermutationResolver,
     clean_help,
+    get_expression_shell,
 )
 from grizzly_ls.model import Step
 
 
 if TYPE_CHECKING:
+    from functools import _lru_cache_wrapper
+
     from grizzly_ls.server import GrizzlyLanguageServer
 
 
+def _prefix_range(items: List[str], prefix: str) -> Tuple[int, int]:
+    """Get start and end index of the items that starts with `prefix`, `items` must be sorted."""
+    start = bisect_left(items, prefix)
+
+    # all items starting with prefix sorts before prefix with the last character "incremented"
+    if len(prefix) < 1:
+        end = len(items)
+    elif ord(prefix[-1]) < sys.maxunicode:
+        end = bisect_left(items, f'{prefix[:-1]}{chr(ord(prefix[-1]) + 1)}', lo=start)
+    else:  # pragma: no cover
+        end = start
+        while end < len(items) and items[end].startswith(prefix):
+            end += 1
+
+    return start, end
+
+
+class StepIndex:
+    """Lookup structures over the normalized step inventory.
+
+    Expressions are kept sorted, so all expressions starting with a given prefix are found in one
+    contiguous range with a binary search, instead of comparing the prefix with every step.
+    """
+
+    _snapshot: List[Tuple[str, List[Step], int]]
+
+    exact_help: Dict[str, Optional[str]]
+    help_cache: _lru_cache_wrapper[Optional[str]]
+    expression_shells: Set[str]
+    expression_steps: Dict[str, Step]
+    expressions: List[str]
+    helps: List[Optional[str]]
+    keyword_expressions: Dict[str, List[str]]
+    keywords_expressions_cache: Dict[Tuple[str, ...], List[str]]
+    close_expressions_cache: _lru_cache_wrapper[List[str]]
+    containing_expressions_cache: _lru_cache_wrapper[List[str]]
+
+    def __init__(self, steps: Dict[str, List[Step]]) -> None:
+        self._snapshot = [(keyword, keyword_steps, len(keyword_steps)) for keyword, keyword_steps in steps.items()]
+        self.exact_help = {}
+        self.keywords_expressions_cache = {}
+        # a new entry is added for (almost) every character typed while writing a step, keep them bounded
+        self.help_cache = lru_cache(maxsize=1024)(self._find_help)
+        self.close_expressions_cache = lru_cache(maxsize=256)(self._find_close_expressions)
+        self.containing_expressions_cache = lru_cache(maxsize=1024)(self._find_containing_expressions)
+        self.expression_shells = set()
+        self.expression_steps = {}
+        self.keyword_expressions = {keyword: sorted(set([step.expression for step in keyword_steps])) for keyword, keyword_steps in steps.items()}
+
+        ordered_steps: List[Tuple[str, int, Optional[str]]] = []
+
+        for keyword_steps in steps.values():
+            keyword_expression_steps: Dict[str, Step] = {}
+
+            for step in keyword_steps:
+                # first step with the expression wins
+                self.exact_help.setdefault(step.expression.strip(), step.help)
+                keyword_expression_steps.setdefault(step.expression, step)
+                # some step expressions might have enum values pre-filled, clean them out
+                self.expression_shells.add(get_expression_shell(step.expression))
+
+                if step.help is not None:
+                    ordered_steps.append((step.expression, len(ordered_steps), step.help))
+
+            # if more than one keyword has a step with the same expression, the last keyword wins
+            self.expression_steps.update(keyword_expression_steps)
+
+        # if expressions are equal, the step that came last in the inventory ends up last
+        ordered_steps.sort(key=lambda ordered_step: ordered_step[:2])
+
+        self.expressions = [expression for expression, _, _ in ordered_steps]
+        self.helps = [help for _, _, help in ordered_steps]
+
+    def is_current(self, steps: Dict[str, List[Step]]) -> bool:
+        """Check if the index was built from the same step lists, that has not been changed in size."""
+        if len(steps) != len(self._snapshot):
+            return False
+
+        return all(steps.get(keyword, None) is keyword_steps and len(keyword_steps) == size for keyword, keyword_steps, size in self._snapshot)
+
+    def find_prefix_help(self, prefix: str) -> Optional[str]:
+        """Get help text for the (lexicographically) greatest expression that starts with `prefix`."""
+        start, end = _prefix_range(self.expressions, prefix)
+
+        if end == start:
+            return None
+
+        return self.helps[end - 1]
+
+    def find_help(self, expression: str, *, exact: bool) -> Optional[str]:
+        """Get help text for `expression`, if `exact` a step with the same expression is preferred.
+
+        Recently used results are cached for the lifetime of the index, i.e. until the step inventory changes.
+        """
+        return self.help_cache(expression, exact)
+
+    def _find_help(self, expression: str, exact: bool) -> Optional[str]:
+        help: Optional[str] = None
+        stripped_expression = expression.strip()
+
+        if exact and stripped_expression in self.exact_help:
+            help = self.exact_help[stripped_expression]
+        else:
+            # help for the (lexicographically) greatest step expression that starts with expression
+            help = self.find_prefix_help(expression)
+
+        return help
+
+    def find_prefix_expressions(self, keyword: str, prefix: str) -> List[str]:
+        """Get all unique expressions for `keyword` that starts with `prefix`."""
+        expressions = self.keyword_expressions.get(keyword, [])
+        start, end = _prefix_range(expressions, prefix)
+
+        return expressions[start:end]
+
+    def find_keywords_expressions(self, keywords: Tuple[str, ...]) -> List[str]:
+        """Get all expressions for `keywords`, in the order of the keywords."""
+        expressions = self.keywords_expressions_cache.get(keywords, None)
+
+        if expressions is None:
+            expressions = list(itertools.chain.from_iterable([self.keyword_expressions.get(keyword, []) for keyword in keywords]))
+            self.keywords_expressions_cache[keywords] = expressions
+
+        return expressions
+
+    def find_containing_expressions(self, keywords: Tuple[str, ...], expression: str) -> List[str]:
+        """Get all expressions for `keywords` that contains `expression`, recently used results are cached for the lifetime of the index."""
+        return self.containing_expressions_cache(keywords, expression)
+
+    def _find_containing_expressions(self, keywords: Tuple[str, ...], expression: str) -> List[str]:
+        return [step_expression for step_expression in self.find_keywords_expressions(keywords) if expression in step_expression]
+
+    def find_close_expressions(self, keywords: Tuple[str, ...], expression: str) -> List[str]:
+        """Get all expressions for `keywords` that are close enough to `expression`.
+
+        Recently used results are cached for the lifetime of the index, values typed between double-quotes does not change
+        the expression shell, so the same fuzzy search is repeated while a step is written.
+        """
+        return self.close_expressions_cache(keywords, expression)
+
+    def _find_close_expressions(self, keywords: Tuple[str, ...], expression: str) -> List[str]:
+        expressions = self.find_keywords_expressions(keywords)
+
+        return get_close_matches(expression, expressions, len(expressions), 0.6)
+
+    def has_expression_shell(self, expression: str) -> bool:
+        """Check if there is a step that matches `expression`, when values enclosed with double-quotes are ignored."""
+        return get_expression_shell(expression) in self.expression_shells
+
+
 def load_step_registry(step_paths: List[Path]) -> Dict[str, List[ParseMatcher]]:
     from behave import step_registry
 
+    # step modules might monkey patch everything with gevent when imported, short-circuit it (causes problems in this context)
+    with suppress(ModuleNotFoundError):
+        import gevent.monkey  # type: ignore
+
+        gevent.monkey.patch_all = lambda: None
+
     with warnings.catch_warnings():
         warnings.simplefilter('ignore')
         behave_load_step_modules([str(step_path) for step_path in step_paths])
@@ -138,6 +303,9 @@ def compile_inventory(ls: GrizzlyLanguageServer, *, standalone: bool = False) ->
     ls.logger.debug('creating step registry')
     project_name = ls.root_path.stem
 
+    # step files might have been added or removed
+    ls._quick_fix_file_cache.clear()
+
     try:
         ls.behave_steps.clear()
         paths = _filter_source_directories(ls.file_ignore_patterns, ls.root_path.rglob('*.py'))
@@ -160,7 +328,7 @@ def compile_inventory(ls: GrizzlyLanguageServer, *, standalone: bool = False) ->
         raise e
 
     try:
-        ls.normalizer = create_step_normalizer(ls)
+        normalizer = create_step_normalizer(ls)
     except ValueError as e:
         if not standalone:
             ls.logger.exception('unable to normalize step expression', notify=True)
@@ -168,6 +336,11 @@ def compile_inventory(ls: GrizzlyLanguageServer, *, standalone: bool = False) ->
 
         raise e
 
+    # normalized patterns only depends on the custom types, keep already normalized patterns if they have not changed
+    previous_normalizer: Optional[Normalizer] = getattr(ls, 'normalizer', None)
+    if previous_normalizer is None or previous_normalizer.custom_types != normalizer.custom_types:
+        ls.normalizer = normalizer
+
     compile_step_inventory(ls)
 
     total_steps = 0
@@ -183,46 +356,92 @@ def compile_step_inventory(ls: GrizzlyLanguageServer) -> None:
     for keyword, steps in ls.behave_steps.items():
         normalized_steps_all: List[Step] = []
         for step in steps:
-            normalized_steps = ls._normalize_step_expression(step)
-            steps_holder: List[Step] = []
+            # registered steps are always matchers, no need to check the type for each of them
+            normalized_steps = ls.normalizer(step.pattern)
 
-            for normalized_step in normalized_steps:
-                help = getattr(step.func, '__doc__', None)
+            # all normalized variants of a step share the same help text
+            help = getattr(step.func, '__doc__', None)
 
-                if help is not None:
-                    help = clean_help(help)
+            if help is not None:
+                help = clean_help(help)
 
-                step_holder = Step(
-                    keyword,
-                    normalized_step,
-                    func=step.func,
-                    help=help,
+            for normalized_step in normalized_steps:
+                normalized_steps_all.append(
+                    Step(
+                        keyword,
+                        normalized_step,
+                        func=step.func,
+                        help=help,
+                    )
                 )
-                steps_holder.append(step_holder)
 
-            normalized_steps_all += steps_holder
+        ls.steps[keyword] = normalized_steps_all
 
-        ls.steps.update({keyword: normalized_steps_all})
 
+@dataclass(frozen=True)
+class LanguageKeywords:
+    """Localized keywords of a language, that does not depend on the step inventory."""
 
-def compile_keyword_inventory(ls: GrizzlyLanguageServer) -> None:
-    ls.localizations = languages.get(ls.language, {})
-    if ls.localizations == {}:
-        raise ValueError(f'unknown language "{ls.language}"')
+    localizations: Dict[str, List[str]]
+    keyword_to_key: Dict[str, str]
+    keywords_any: FrozenSet[str]
+    keywords_all: FrozenSet[str]
+    keywords_headers: FrozenSet[str]
 
-    # localized any keywords
-    ls.keywords_any = list(
-        set(
+
+@lru_cache(maxsize=16)
+def get_language_keywords(language: str) -> LanguageKeywords:
+    """Get localized keywords of `language`, they never change so they are created once per language.
+
+    Not bound to the current language of the server, so it can be used for a specific document in another thread.
+    """
+    localizations = languages.get(language, {})
+
+    if localizations == {}:
+        raise ValueError(f'unknown language "{language}"')
+
+    # inverted localizations, first key wins if a keyword exists for more than one key
+    keyword_to_key: Dict[str, str] = {}
+    for key, values in localizations.items():
+        for value in values:
+            keyword_to_key.setdefault(value, key)
+
+    keywords_headers: List[str] = []
+    keywords_all: List[str] = []
+    for key, values in localizations.items():
+        if values[0] != u'*':
+            keywords_headers.extend([*localizations.get(key, [])])
+            keywords_all.extend([*values])
+        else:
+            keywords_all.extend([*values[1:]])
+
+    return LanguageKeywords(
+        localizations=localizations,
+        keyword_to_key=keyword_to_key,
+        # localized any keywords, only used for membership tests
+        keywords_any=frozenset(
             [
                 '*',
-                *ls.localizations.get('but', []),
-                *ls.localizations.get('and', []),
+                *localizations.get('but', []),
+                *localizations.get('and', []),
             ]
-        )
+        ),
+        keywords_all=frozenset(keywords_all),
+        keywords_headers=frozenset(keywords_headers),
     )
 
+
+def compile_keyword_inventory(ls: GrizzlyLanguageServer) -> None:
+    language_keywords = get_language_keywords(ls.language)
+
+    ls.localizations = language_keywords.localizations
+    ls.keyword_to_key = language_keywords.keyword_to_key
+    ls.keywords_any = language_keywords.keywords_any
+    ls.keywords_headers = language_keywords.keywords_headers
+    ls.keywords_all = language_keywords.keywords_all
+
     # localized keywords that should only appear once
-    ls.keywords_once = list(
+    ls.keywords_once = sorted(
         set(
             [
                 *ls.localizations.get('feature', []),
@@ -231,14 +450,12 @@ def compile_keyword_inventory(ls: GrizzlyLanguageServer) -> None:
         )
     )
 
-    ls.keywords_headers = []
-    ls.keywords_all = []
-    for key, values in ls.localizations.items():
-        if values[0] != u'*':
-            ls.keywords_headers.extend([*ls.localizations.get(key, [])])
-            ls.keywords_all.extend([*values])
-        else:
-            ls.keywords_all.extend([*values[1:]])
+    # find scenario keywords, and keywords that should only appear once, in a document with one scan each, `(?!)` never matches.
+    # lookahead so that a keyword is also found when it is the end of another keyword
+    keywords_scenario = '|'.join(re.escape(keyword) for keyword in [*ls.localizations.get('scenario', []), *ls.localizations.get('scenario_outline', [])])
+    ls.keywords_scenario_pattern = re.compile(keywords_scenario if keywords_scenario else r'(?!)')
+    keywords_once = '|'.join(re.escape(keyword) for keyword in ls.keywords_once)
+    ls.keywords_once_pattern = re.compile(f'(?=({keywords_once}):)' if keywords_once else r'(?!)')
 
     # localized keywords
     ls.keywords = list(
@@ -260,3 +477,7 @@ def compile_keyword_inventory(ls: GrizzlyLanguageServer) -> None:
                 continue
 
             ls.keywords.append(value.strip())
+
+    # keep sorted, suggestions are sorted and that is cheap when they are merged from already sorted lists
+    ls.keywords.sort()
+    ls.keywords_lookup = frozenset(ls.keywords)
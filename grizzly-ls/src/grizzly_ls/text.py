@@ -28,6 +28,7 @@ from tokenize import TokenInfo
 
 from lsprotocol.types import Position
 from pygls.workspace import TextDocument
+from behave.i18n import languages
 
 from grizzly_ls.constants import MARKER_LANGUAGE
 
@@ -217,32 +218,46 @@ class NormalizeHolder:
     replacements: List[str]
 
 
+_UNTYPED_VARIABLE = re.compile(r'\{[^\}:]*\}')
+_TYPED_VARIABLE = re.compile(r'\{[^:]*:([^\}]*)\}')
+
+
 class Normalizer:
     ls: GrizzlyLanguageServer
     custom_types: Dict[str, NormalizeHolder]
 
+    _cache: Dict[str, Tuple[str, ...]]
+
     def __init__(self, ls: GrizzlyLanguageServer, custom_types: Dict[str, NormalizeHolder]) -> None:
         self.ls = ls
         self.custom_types = custom_types
+        self._cache = {}
 
     def __call__(self, pattern: str) -> List[str]:
+        # the result only depends on the pattern and custom types, and a new normalizer
+        # is created every time the inventory is compiled
+        patterns = self._cache.get(pattern, None)
+        if patterns is None:
+            patterns = tuple(self.normalize(pattern))
+            self._cache[pattern] = patterns
+
+        return list(patterns)
+
+    def normalize(self, pattern: str) -> List[str]:
         patterns: List[str] = []
 
         # replace all non typed variables first, will only result in 1 step
-        regex = r'\{[^\}:]*\}'
-        has_matches = re.search(regex, pattern)
+        has_matches = _UNTYPED_VARIABLE.search(pattern)
         if has_matches:
-            matches = re.finditer(regex, pattern)
+            matches = _UNTYPED_VARIABLE.finditer(pattern)
             for match in matches:
                 pattern = pattern.replace(match.group(0), '')
 
         # replace all typed variables, can result in more than 1 step
-        typed_regex = r'\{[^:]*:([^\}]*)\}'
-
         normalize: Dict[str, NormalizeHolder] = {}
-        has_typed_matches = re.search(typed_regex, pattern)
+        has_typed_matches = _TYPED_VARIABLE.search(pattern)
         if has_typed_matches:
-            typed_matches = re.finditer(typed_regex, pattern)
+            typed_matches = _TYPED_VARIABLE.finditer(pattern)
             for match in typed_matches:
                 variable = match.group(0)
                 variable_type = match.group(1)
@@ -346,23 +361,32 @@ class Normalizer:
         return patterns
 
 
+_MULTIPLE_WHITESPACE = re.compile(r'\s{2,}')
+QUOTED_VALUE = re.compile(r'"([^"]*)"')
+
+
 def get_step_parts(line: str) -> Tuple[Optional[str], Optional[str]]:
-    if len(line) > 0:
-        # remove multiple white spaces
-        line = re.sub(r'^\s+', '', line)
-        line = re.sub(r'\s{2,}', ' ', line)
-        if sys.platform == 'win32':  # pragma: no cover
-            line = line.replace('\r', '')
+    if len(line) < 1:
+        return None, None
 
-        try:
-            keyword, step = line.split(' ', 1)
-        except ValueError:
-            keyword, step = line, None
-        keyword = keyword.strip()
-    else:
-        keyword, step = None, None
+    # remove multiple white spaces
+    line = _MULTIPLE_WHITESPACE.sub(' ', line.lstrip())
+    if sys.platform == 'win32':  # pragma: no cover
+        line = line.replace('\r', '')
+
+    keyword, separator, step = line.partition(' ')
+
+    # trailing white spaces in step are significant when completing
+    return keyword.strip(), step if separator else None
 
-    return keyword, step
+
+def get_expression_shell(expression: str) -> str:
+    """Remove any user values enclosed with double-quotes, e.g. `value for "foo" is "bar"` -> `value for "" is ""`."""
+    # most expressions does not have any values, no need to run the pattern for them
+    if '"' not in expression:
+        return expression
+
+    return QUOTED_VALUE.sub('""', expression)
 
 
 def clean_help(text: str) -> str:
@@ -432,12 +456,37 @@ def format_arg_line(line: str) -> str:
         return f'* {line}'
 
 
-def find_language(source: str) -> str:
+# language code, and lower cased english and native name, of all languages, used when matching what has been typed
+LANGUAGE_NAMES: List[Tuple[str, str, str]] = [
+    (lang, localization.get('name', [''])[0].lower(), localization.get('native', [''])[0].lower()) for lang, localization in languages.items()
+]
+
+
+def find_language_header(source: str) -> Tuple[str, Optional[int]]:
+    """Get language, and the line where the search for the language marker stopped.
+
+    Changes after that line can not change the language of the source. Line is `None` if the whole source was searched.
+    """
     language: str = 'en'
+    lineno: Optional[int] = None
+
+    # the language marker can only be in the comments before the first statement, no need to split (or copy) the whole source
+    index = 0
+    start = 0
+    while start < len(source):
+        end = source.find('\n', start)
+        if end < 0:
+            end = len(source)
+
+        line = source[start:end].strip()
+        start = end + 1
+
+        if len(line) > 0 and not line.startswith('#'):
+            lineno = index
+            break
 
-    for line in source.splitlines():
-        line = line.strip()
         if line.startswith(MARKER_LANGUAGE):
+            lineno = index
             try:
                 _, lang = line.strip().split(': ', 1)
                 lang = lang.strip()
@@ -448,6 +497,14 @@ def find_language(source: str) -> str:
             finally:
                 break
 
+        index += 1
+
+    return language, lineno
+
+
+def find_language(source: str) -> str:
+    language, _ = find_language_header(source)
+
     return language
 
 
@@ -5,7 +5,7 @@ import re
 import sys
 import traceback
 
-from typing import Dict, List, Optional, Tuple, Union, Iterable, Set, Any
+from typing import Dict, Generator, List, Optional, Tuple, Union, Iterable, Set, Any, cast
 from pathlib import Path
 from contextlib import suppress
 from textwrap import dedent
@@ -21,55 +21,59 @@ from lsprotocol import types as lsp
 logger = logging.getLogger(__name__)
 
 
-def run_command(
+def run_command_iter(
     command: List[str],
     env: Optional[Dict[str, str]] = None,
     cwd: Optional[str] = None,
-) -> Tuple[int, List[str]]:
+) -> Generator[str, None, int]:
+    """Run command and yield output (stdout and stderr) line by line as it is written, the return code of the
+    command is the return value of the generator."""
     logger.debug(f'executing command: {" ".join(command)}')
-    output: List[str] = []
-
-    if env is None:
-        env = os.environ.copy()
-
-    if cwd is None:
-        cwd = os.getcwd()
 
+    # environment and working directory is inherited if not specified
     process = subprocess.Popen(
         command,
         env=env,
         cwd=cwd,
         stderr=subprocess.STDOUT,
         stdout=subprocess.PIPE,
+        text=True,
+        errors='replace',
+        bufsize=1,
     )
 
     try:
-        while process.poll() is None:
-            stdout = process.stdout
-            if stdout is None:  # pragma: no cover
-                break
+        stdout = process.stdout
+        if stdout is not None:  # pragma: no branch
+            # read until EOF, so output written right before the process exits isn't lost
+            for line in stdout:
+                yield line
 
-            buffer = stdout.readline()
-            if not buffer:
-                break
+        return process.wait()
+    finally:
+        # generator was closed, or the consumer failed, before all output was read
+        if process.poll() is None:
+            with suppress(Exception):
+                process.kill()
+            process.wait()
 
-            try:
-                output.append(buffer.decode())
-            except Exception:
-                logger.exception(buffer)
+        if process.stdout is not None:  # pragma: no branch
+            process.stdout.close()
 
-        process.terminate()
-    except KeyboardInterrupt:  # pragma: no cover
-        pass
-    finally:
-        try:
-            process.kill()
-        except Exception:  # pragma: no cover
-            pass
 
-    process.wait()
+def run_command(
+    command: List[str],
+    env: Optional[Dict[str, str]] = None,
+    cwd: Optional[str] = None,
+) -> Tuple[int, List[str]]:
+    output: List[str] = []
+    lines = run_command_iter(command, env=env, cwd=cwd)
 
-    return process.returncode, output
+    while True:
+        try:
+            output.append(next(lines))
+        except StopIteration as e:
+            return cast(int, e.value), output
 
 
 class MissingScenario(Exception):
@@ -86,6 +90,14 @@ class MissingScenario(Exception):
         return f'Scenario "{self.scenario}" does not exist in included feature "{self.feature}"'
 
 
+_PY2LSP_LEVEL: Dict[int, lsp.MessageType] = {
+    logging.INFO: lsp.MessageType.Info,
+    logging.ERROR: lsp.MessageType.Error,
+    logging.WARNING: lsp.MessageType.Warning,
+    logging.DEBUG: lsp.MessageType.Debug,
+}
+
+
 class LogOutputChannelLogger:
     ls: LanguageServer
     logger: logging.Logger
@@ -98,16 +110,7 @@ class LogOutputChannelLogger:
 
     @classmethod
     def py2lsp_level(cls, level: int) -> lsp.MessageType:
-        if level == logging.INFO:
-            return lsp.MessageType.Info
-        elif level == logging.ERROR:
-            return lsp.MessageType.Error
-        elif level == logging.WARNING:
-            return lsp.MessageType.Warning
-        elif level == logging.DEBUG:
-            return lsp.MessageType.Debug
-
-        return lsp.MessageType.Log
+        return _PY2LSP_LEVEL.get(level, lsp.MessageType.Log)
 
     def get_current_exception(self) -> Optional[str]:
         _, _, trace = sys.exc_info()
@@ -117,7 +120,14 @@ class LogOutputChannelLogger:
 
         return f'Stack trace:\n{"".join(traceback.format_tb(trace))}'
 
+    def is_enabled_for(self, level: int) -> bool:
+        # when embedded all messages are sent to the output channel, which filters on level by itself
+        return self.embedded or self.logger.isEnabledFor(level)
+
     def log(self, level: int, message: str, *, exc_info: bool, notify: bool) -> None:
+        if not notify and not self.is_enabled_for(level):
+            return
+
         msg_type = self.py2lsp_level(level)
         if not self.embedded:
             self.logger.log(level, message, exc_info=exc_info)
@@ -154,8 +164,9 @@ class ScenarioTag(StandaloneTag):
         return super().preprocess(source, name, filename)
 
     @classmethod
-    def get_scenario_text(cls, name: str, file: Path) -> str:
-        content = file.read_text()
+    def get_scenario_text(cls, name: str, file: Path, content: Optional[str] = None) -> str:
+        if content is None:
+            content = file.read_text()
 
         content_skel = re.sub(r'\{%.*%\}', '', content)
         content_skel = re.sub(r'\{\$.*\$\}', '', content_skel)
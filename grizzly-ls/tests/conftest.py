@@ -2,6 +2,10 @@ from typing import Generator
 from pathlib import Path
 
 import pytest
+import gevent.monkey  # type: ignore
+
+# monkey patch functions to short-circuit them (causes problems in this context)
+gevent.monkey.patch_all = lambda: None
 
 from .fixtures import LspFixture
 
@@ -33,19 +33,38 @@ def test_initialize(lsp_fixture: LspFixture) -> None:
                     'foo bar is a (nice|bad) word',
                     '.*and they lived (happy|unfortunate) ever after',
                     '^foo(bar)$',
+                    r'costs (\d+) \$',
                 ]
             },
         )
 
         assert not server.steps == {}
         assert isinstance(server.variable_pattern, re.Pattern)
-        assert '^.*hello "([^"]*)"!$' in server.variable_pattern.pattern
-        assert '^.*foo bar is a (nice|bad) word$' in server.variable_pattern.pattern
-        assert '^.*and they lived (happy|unfortunate) ever after$' in server.variable_pattern.pattern
-        assert '^foo(bar)$' in server.variable_pattern.pattern
-        assert server.variable_pattern.pattern.count('^') == 4 + 1  # first pattern has ^ in the pattern...
-        assert server.variable_pattern.pattern.count('(') == 5
-        assert server.variable_pattern.pattern.count(')') == 5
+        assert server.variable_pattern.pattern == r'^(?:.*(?:and they lived (happy|unfortunate) ever after|foo bar is a (nice|bad) word|hello "([^"]*)"!|costs (\d+) \$)|foo(bar))$'
+        assert server.variable_pattern.groups == 5
+        match = server.variable_pattern.match('    Given hello "world"!')
+        assert match is not None
+        assert match.groups() == (None, None, 'world', None, None)
+        match = server.variable_pattern.match('foobar')
+        assert match is not None
+        assert match.groups() == (None, None, None, None, 'bar')
+        assert server.variable_pattern.match('and foobar') is None
+        # escaped "$" is a literal dollar sign
+        match = server.variable_pattern.match('    Then it costs 10 $')
+        assert match is not None
+        assert match.groups() == (None, None, None, '10', None)
+        assert (
+            server._variable_pattern_cache[
+                (
+                    '.*and they lived (happy|unfortunate) ever after',
+                    '^foo(bar)$',
+                    r'costs (\d+) \$',
+                    'foo bar is a (nice|bad) word',
+                    'hello "([^"]*)"!$',
+                )
+            ]
+            is server.variable_pattern
+        )
 
         keywords = list(server.steps.keys())
 
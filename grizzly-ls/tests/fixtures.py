@@ -7,6 +7,7 @@ from threading import Thread
 from pathlib import Path
 from importlib import reload as reload_module
 from logging import DEBUG
+from time import sleep
 
 from pygls.server import LanguageServer
 from lsprotocol.types import EXIT
@@ -74,6 +75,13 @@ class LspFixture:
         self._client_thread = Thread(target=start, args=(self.client, sstdio, cstdout), daemon=True)
         self._client_thread.start()
 
+        # messages sent before both ends are connected are lost
+        for ls in [self.server, self.client]:
+            for _ in range(500):
+                if ls.lsp.transport is not None:
+                    break
+                sleep(0.01)
+
         self.datadir = (Path(__file__).parent / '..' / '..' / 'tests' / 'project').resolve()
 
         return self
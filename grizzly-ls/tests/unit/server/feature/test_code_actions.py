@@ -62,9 +62,16 @@ def test_quick_fix_no_step_impl(lsp_fixture: LspFixture, mocker: MockerFixture)
 
         # all good
         ls.root_path = GRIZZLY_PROJECT
+        removed_file = GRIZZLY_PROJECT / 'steps' / 'removed.py'
+        ls._quick_fix_file_cache = {GRIZZLY_PROJECT: (removed_file, removed_file.as_uri())}
 
         quick_fix = quick_fix_no_step_impl(ls, diagnostic, text_document)
         assert quick_fix is not None
+        assert ls._quick_fix_file_cache == {GRIZZLY_PROJECT: (expected_quick_fix_file, expected_quick_fix_file.as_uri())}
+        assert ls._line_count_cache[expected_quick_fix_file] == (
+            expected_quick_fix_file.stat().st_mtime_ns,
+            len(expected_quick_fix_file.read_text().splitlines()),
+        )
 
         assert quick_fix.title == 'Create step implementation'
         assert quick_fix.kind == lsp.CodeActionKind.QuickFix
@@ -153,10 +160,6 @@ def step_impl(context: Context) -> None:
         # // -->
 
         # <!-- with arguments
-        mocker.patch(
-            'random_word.RandomWords.get_random_word',
-            return_value='foobar',
-        )
         diagnostic = lsp.Diagnostic(
             range=lsp.Range(
                 start=lsp.Position(line=0, character=0),
@@ -186,8 +189,8 @@ def step_impl(context: Context) -> None:
         assert (
             actual_text_edit.new_text
             == '''
-@step(given, en=u'a "{book}" with "{foobar}" pages')
-def step_impl(context: Context, book: str, foobar: str) -> None:
+@step(given, en=u'a "{book}" with "{arg2}" pages')
+def step_impl(context: Context, book: str, arg2: str) -> None:
     raise NotImplementedError('no step implementation')
 '''
         )
@@ -196,6 +199,21 @@ def step_impl(context: Context, book: str, foobar: str) -> None:
         expected_position = lsp.Position(line=len(source), character=0)
 
         assert actual_text_edit.range == lsp.Range(start=expected_position, end=expected_position)
+
+        # variable name shorter than the value it replaces
+        diagnostic.message = f'{MARKER_NO_STEP_IMPL}:\nGiven a "very long name" and "x"'
+
+        quick_fix = quick_fix_no_step_impl(ls, diagnostic, text_document)
+        assert quick_fix is not None
+        assert quick_fix.edit is not None and quick_fix.edit.changes is not None
+        assert (
+            quick_fix.edit.changes[expected_quick_fix_file.as_uri()][0].new_text
+            == '''
+@step(given, en=u'a "{arg1}" and "{x}"')
+def step_impl(context: Context, arg1: str, x: str) -> None:
+    raise NotImplementedError('no step implementation')
+'''
+        )
         # // -->
 
         # <!-- error...
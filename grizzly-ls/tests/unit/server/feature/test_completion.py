@@ -473,6 +473,19 @@ def test_complete_variable_name(lsp_fixture: LspFixture) -> None:
     actual_text_edits = sorted([actual_item.text_edit.new_text for actual_item in actual_items if actual_item.text_edit is not None])
     assert actual_text_edits == sorted(['foo }}"', 'foobar }}"'])
 
+    # windows line endings, lines of the same document version are shared with other handlers
+    text_document = TextDocument(
+        uri='file:///test.feature',
+        source=text_document.source.replace('\n', '\r\n'),
+        version=1,
+    )
+    try:
+        actual_items = complete_variable_name(ls, 'Then log message "{{', text_document, lsp.Position(line=7, character=19))
+        assert sorted([actual_item.label for actual_item in actual_items]) == sorted(['foo', 'bar', 'foobar'])
+        assert ls._line_cache['file:///test.feature'][0] == 1
+    finally:
+        ls._line_cache.clear()
+
 
 def test_complete_expression(lsp_fixture: LspFixture) -> None:
     ls = lsp_fixture.server
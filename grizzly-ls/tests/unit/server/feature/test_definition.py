@@ -13,6 +13,7 @@ from _pytest.logging import LogCaptureFixture
 from grizzly_ls.server.features.definition import (
     get_step_definition,
     get_file_url_definition,
+    _get_step_location,
 )
 from grizzly_ls.model import Step
 from tests.fixtures import LspFixture
@@ -52,12 +53,19 @@ def test_get_step_definition(lsp_fixture: LspFixture) -> None:
         end=lsp.Position(line=lineno, character=0),
     )
 
+    # location of the step function is only looked up once
+    hits = _get_step_location.cache_info().hits
+    assert get_step_definition(ls, params, 'Given hello world!') == actual_definition
+    assert _get_step_location.cache_info().hits == hits + 1
+
 
 def test_get_file_url_definition(lsp_fixture: LspFixture, caplog: LogCaptureFixture) -> None:
     ls = lsp_fixture.server
     ls.root_path = GRIZZLY_PROJECT
     ls.lsp._workspace = Workspace(ls.root_path.as_uri())
 
+    assert ls.requests_path == GRIZZLY_PROJECT / 'features' / 'requests'
+
     test_feature_file = ls.root_path / 'features' / 'empty.feature'
     test_file = ls.root_path / 'features' / 'requests' / 'test.txt'
     test_file.parent.mkdir(parents=True, exist_ok=True)
@@ -89,6 +97,9 @@ def test_get_file_url_definition(lsp_fixture: LspFixture, caplog: LogCaptureFixt
         position = lsp.Position(line=0, character=0)
         params = lsp.DefinitionParams(text_document, position)
 
+        # nothing quoted
+        assert get_file_url_definition(ls, params, 'Then this is not a variable') == []
+
         # no files
         assert (
             get_file_url_definition(
@@ -5,8 +5,11 @@ from itertools import product
 from pygls.workspace import TextDocument
 from lsprotocol import types as lsp
 from _pytest.logging import LogCaptureFixture
+from pytest_mock import MockerFixture
 
-from grizzly_ls.server.features.diagnostics import validate_gherkin
+from grizzly_ls.server.features import diagnostics as diagnostics_module
+from grizzly_ls.server.features.diagnostics import validate_gherkin, _remove_scenario_tags
+from grizzly_ls.utils import ScenarioTag
 from grizzly_ls.model import Step
 
 from tests.fixtures import LspFixture
@@ -121,6 +124,10 @@ Feature:
     assert diagnostic.tags is None
     assert diagnostic.related_information is None
     assert diagnostic.data is None
+
+    # language of the document is used, not the current language of the server
+    ls.language = 'en'
+    assert validate_gherkin(ls, text_document) == diagnostics
     # // -->
 
     # <!-- step implementation not found
@@ -304,7 +311,7 @@ Egenskap: hello
     # // -->
 
 
-def test_validate_gherkin_scenario_tag(lsp_fixture: LspFixture, caplog: LogCaptureFixture) -> None:
+def test_validate_gherkin_scenario_tag(lsp_fixture: LspFixture, caplog: LogCaptureFixture, mocker: MockerFixture) -> None:
     ls = lsp_fixture.server
 
     feature_file = lsp_fixture.datadir / 'features' / 'test_validate_gherkin_scenario_tag.feature'
@@ -540,7 +547,43 @@ Scenario: foo
 
         diagnostics = validate_gherkin(ls, text_document)
         assert diagnostics == []
+
+        # all variables on a line are found, and variables in comments are not used
+        included_feature_file.write_text(
+            """Feature:
+    Scenario: include
+        Given a step expression named "{$ foo $}" and "{$ baz $}"
+        # And a step expression named "{$ bar $}"
+
+""",
+            encoding='utf-8',
+        )
+        text_document = TextDocument(feature_file.as_posix())
+
+        diagnostics = validate_gherkin(ls, text_document)
+
+        assert [diagnostic.message for diagnostic in diagnostics] == [
+            'Declared variable "bar" is not used in included scenario steps',
+            'Scenario tag is missing variable "baz"',
+        ]
+
+        # included feature file has not changed, so it is not parsed again, only the document itself
+        parse_feature_spy = mocker.spy(diagnostics_module, 'parse_feature')
+        get_scenario_text_spy = mocker.spy(ScenarioTag, 'get_scenario_text')
+
+        assert validate_gherkin(ls, text_document) == diagnostics
+        assert parse_feature_spy.call_count == 1
+        get_scenario_text_spy.assert_not_called()
         # // -->
     finally:
         included_feature_file.unlink(missing_ok=True)
         feature_file.unlink(missing_ok=True)
+
+
+def test__remove_scenario_tags() -> None:
+    assert _remove_scenario_tags('Feature: test\n    Scenario: test\n') == 'Feature: test\n    Scenario: test\n'
+    assert (
+        _remove_scenario_tags('Feature: test\n\n    Scenario: test\n        {% scenario "foo", feature="./foo.feature" %}\n        Given a step\n{% scenario "bar" %}')
+        == 'Feature: test\n\n    Scenario: test\n        Given a step\n'
+    )
+    assert _remove_scenario_tags('Feature: test\r\n    {% scenario "foo" %}\r\n    Scenario: test\r\n') == 'Feature: test\r\n    Scenario: test\r\n'
@@ -1,7 +1,11 @@
 import logging
+import subprocess
+import sys
 
 from typing import Dict, List
 from contextlib import suppress
+from os.path import devnull
+from pathlib import Path
 
 import pytest
 import gevent.monkey  # type: ignore
@@ -14,14 +18,25 @@ from pytest_mock import MockerFixture
 
 from lsprotocol import types as lsp
 from behave.matchers import ParseMatcher
-from pygls.workspace import TextDocument
+from pygls.workspace import TextDocument, Workspace
 
 from tests.fixtures import LspFixture
 from tests.conftest import GRIZZLY_PROJECT
 from grizzly_ls import __version__
-from grizzly_ls.server import Step
+from grizzly_ls.server import (
+    Step,
+    _uri_to_path,
+    _get_pip_config_files,
+    _read_pip_index_url,
+    text_document_completion,
+    text_document_hover,
+    text_document_definition,
+    workspace_diagnostic,
+    command_rebuild_inventory,
+)
 from grizzly_ls.server.inventory import compile_inventory
 from grizzly_ls.utils import LogOutputChannelLogger
+from grizzly_ls.text import find_language_header
 
 
 class TestGrizzlyLanguageServer:
@@ -93,6 +108,8 @@ class TestGrizzlyLanguageServer:
             )
             assert sorted(ls.keywords_any) == sorted(words.get('keywords_any', []))
             assert sorted(ls.keywords_once) == sorted(words.get('keywords_once', []))
+            assert all(keyword in ls.keywords_headers and keyword in ls.keywords_all for keyword in ls.keywords_once)
+            assert isinstance(ls.keywords_any, frozenset)
 
             assert isinstance(ls.logger, LogOutputChannelLogger)
             assert ls.logger.logger.name == 'GrizzlyLanguageServer'
@@ -121,6 +138,12 @@ class TestGrizzlyLanguageServer:
 
         assert ls._normalize_step_expression(step) == ['hello ""! how "" you']
 
+        # normalized patterns are cached per normalizer
+        normalize_spy = mocker.spy(ls.normalizer, 'normalize')
+        assert ls._normalize_step_expression(step) == ['hello ""! how "" you']
+        normalize_spy.assert_not_called()
+        mocker.stop(normalize_spy)
+
         step = ParseMatcher(noop, 'you have "{count}" {grammar:UserGramaticalNumber}')
 
         assert sorted(ls._normalize_step_expression(step)) == sorted(
@@ -348,6 +371,295 @@ Scenario: test scenario
             assert ls.get_base_keyword(lsp.Position(line=3, character=0), text_document) == 'Given'
 
             assert ls.get_base_keyword(lsp.Position(line=2, character=0), text_document) == 'Given'
+
+            # lines of versioned documents are reused, position after the last line is the last line
+            text_document = TextDocument(feature_file.as_uri(), f'{feature_file.read_text()}\n', version=1)
+            assert ls.get_base_keyword(lsp.Position(line=8, character=0), text_document) == 'Then'
+            assert ls._line_cache[feature_file.as_uri()][0] == 1
+            assert ls.get_base_keyword(lsp.Position(line=3, character=0), text_document) == 'Given'
         finally:
+            ls._line_cache.clear()
             with suppress(Exception):
                 feature_file.unlink()
+
+    def test_get_current_line(self, lsp_fixture: LspFixture) -> None:
+        ls = lsp_fixture.server
+        ls._line_cache.clear()
+
+        text_document = TextDocument('file:///test.feature', 'Feature:\n    Scenario: test\n', version=1)
+
+        assert ls.get_current_line(text_document, lsp.Position(line=1, character=0)) == '    Scenario: test'
+        cached_version, cached_lines = ls._line_cache['file:///test.feature']
+        assert cached_version == 1
+
+        assert ls.get_current_line(text_document, lsp.Position(line=0, character=0)) == 'Feature:'
+        assert ls._line_cache['file:///test.feature'][1] is cached_lines
+
+        text_document = TextDocument('file:///test.feature', 'Feature:\n    Scenario: foo\n', version=2)
+        assert ls.get_current_line(text_document, lsp.Position(line=1, character=0)) == '    Scenario: foo'
+        assert ls._line_cache['file:///test.feature'][0] == 2
+
+        # documents without version are not cached
+        ls._line_cache.clear()
+        text_document = TextDocument('file:///test.feature', 'Feature:\n')
+        assert ls.get_current_line(text_document, lsp.Position(line=0, character=0)) == 'Feature:'
+        assert ls._line_cache == {}
+
+        with pytest.raises(IndexError):
+            ls.get_current_line(text_document, lsp.Position(line=10, character=0))
+
+    def test_detect_language(self, lsp_fixture: LspFixture, mocker: MockerFixture) -> None:
+        ls = lsp_fixture.server
+        ls._language_cache.clear()
+        find_language_header_spy = mocker.patch('grizzly_ls.server.find_language_header', wraps=find_language_header)
+
+        try:
+            text_document = TextDocument('file:///test.feature', '# language: sv\nEgenskap: test\n', version=1)
+            ls.detect_language(text_document)
+            assert ls.language == 'sv'
+            assert ls._language_cache['file:///test.feature'] == ('sv', 0)
+            assert find_language_header_spy.call_count == 1
+
+            # changes after the language marker
+            ls.language = 'en'
+            change = lsp.TextDocumentContentChangeEvent_Type1(
+                range=lsp.Range(start=lsp.Position(line=1, character=0), end=lsp.Position(line=1, character=0)),
+                text='  ',
+            )
+            ls.detect_language(text_document, [change])
+            assert ls.language == 'sv'
+            assert find_language_header_spy.call_count == 1
+
+            # change of the language marker, or the whole document
+            change.range.start.line = 0
+            ls.detect_language(text_document, [change])
+            assert find_language_header_spy.call_count == 2
+
+            ls.detect_language(text_document, [lsp.TextDocumentContentChangeEvent_Type2(text='')])
+            assert find_language_header_spy.call_count == 3
+
+            # invalid language
+            text_document = TextDocument('file:///test.feature', '# language: asdf\n', version=2)
+            ls.detect_language(text_document)
+            assert ls.language == 'en'
+        finally:
+            ls.language = 'en'
+            ls._language_cache.clear()
+
+    def test_publish_diagnostics_in_background(self, lsp_fixture: LspFixture, mocker: MockerFixture) -> None:
+        ls = lsp_fixture.server
+        get_diagnostics_mock = mocker.patch.object(ls, 'get_diagnostics', return_value=[])
+        publish_diagnostics_mock = mocker.patch.object(ls, 'publish_diagnostics', return_value=None)
+        show_message_mock = mocker.patch.object(ls, 'show_message', autospec=True)
+
+        text_document = TextDocument('file:///test.feature', 'Feature:\n', version=1)
+
+        try:
+            # first validation is skipped, since a newer has been requested before it started
+            with ls._diagnostics_lock:
+                first = ls.publish_diagnostics_in_background(text_document)
+                second = ls.publish_diagnostics_in_background(text_document, force=True)
+
+            first.result(timeout=5)
+            second.result(timeout=5)
+
+            get_diagnostics_mock.assert_called_once_with(text_document, force=True)
+            publish_diagnostics_mock.assert_called_once_with('file:///test.feature', [])
+            show_message_mock.assert_not_called()
+
+            # inventory is not ready, open documents are validated when it is
+            ls._ready.clear()
+            try:
+                ls.publish_diagnostics_in_background(text_document, force=True).result(timeout=5)
+            finally:
+                ls._ready.set()
+            get_diagnostics_mock.assert_called_once_with(text_document, force=True)
+
+            get_diagnostics_mock.side_effect = RuntimeError('error')
+            ls.publish_diagnostics_in_background(text_document).result(timeout=5)
+            show_message_mock.assert_called_once_with('failed to run diagnostics on file:///test.feature', msg_type=lsp.MessageType.Error)
+        finally:
+            ls._diagnostics_pending.clear()
+
+    def test_workspace_diagnostic(self, lsp_fixture: LspFixture, mocker: MockerFixture) -> None:
+        ls = lsp_fixture.server
+        get_diagnostics_mock = mocker.patch.object(ls, 'get_diagnostics', return_value=[])
+        original_settings = ls.client_settings.copy()
+
+        assert getattr(workspace_diagnostic, 'execute_in_thread', False)
+
+        for uri, language_id, version in [('file:///a.feature', 'grizzly-gherkin', 1), ('file:///b.py', 'python', 1), ('file:///c.feature', 'grizzly-gherkin', 3)]:
+            ls.workspace.put_text_document(lsp.TextDocumentItem(uri=uri, language_id=language_id, version=version, text='Feature:\n'))
+
+        try:
+            ls.client_settings.update({'diagnostics_on_save_only': False})
+            report = workspace_diagnostic(ls, lsp.WorkspaceDiagnosticParams(previous_result_ids=[]))
+
+            assert [(item.uri, item.version) for item in report.items] == [('file:///a.feature', 1), ('file:///c.feature', 3)]
+            assert get_diagnostics_mock.call_count == 2
+
+            ls.client_settings.update({'diagnostics_on_save_only': True})
+            report = workspace_diagnostic(ls, lsp.WorkspaceDiagnosticParams(previous_result_ids=[]))
+
+            assert [item.uri for item in report.items] == ['file:///a.feature', 'file:///c.feature']
+            assert get_diagnostics_mock.call_count == 2
+        finally:
+            ls.client_settings = original_settings
+            for uri in ['file:///a.feature', 'file:///b.py', 'file:///c.feature']:
+                ls.workspace.remove_text_document(uri)
+
+    def test_get_diagnostics(self, lsp_fixture: LspFixture, mocker: MockerFixture) -> None:
+        ls = lsp_fixture.server
+        ls._diagnostics_cache.clear()
+
+        validate_gherkin_mock = mocker.patch('grizzly_ls.server.validate_gherkin', side_effect=lambda *_: [])
+
+        text_document = TextDocument('file:///test.feature', 'Feature:\n', version=1)
+
+        diagnostics = ls.get_diagnostics(text_document)
+        assert ls.get_diagnostics(text_document) is diagnostics
+        assert validate_gherkin_mock.call_count == 1
+
+        assert ls.get_diagnostics(text_document, force=True) is not diagnostics
+        assert validate_gherkin_mock.call_count == 2
+
+        text_document = TextDocument('file:///test.feature', 'Feature:\n', version=2)
+        ls.get_diagnostics(text_document)
+        assert validate_gherkin_mock.call_count == 3
+
+        # step inventory changed
+        ls._step_index = None
+        ls.get_diagnostics(text_document)
+        ls.get_diagnostics(text_document)
+        assert validate_gherkin_mock.call_count == 4
+
+        # documents without version are not cached
+        ls._diagnostics_cache.clear()
+        text_document = TextDocument('file:///test.feature', 'Feature:\n')
+        ls.get_diagnostics(text_document)
+        ls.get_diagnostics(text_document)
+        assert validate_gherkin_mock.call_count == 6
+        assert ls._diagnostics_cache == {}
+
+    def test_command_rebuild_inventory(self, lsp_fixture: LspFixture, mocker: MockerFixture) -> None:
+        ls = lsp_fixture.server
+
+        def compile_inventory_mock(ls_: object) -> None:
+            assert not ls._ready.is_set()
+            assert ls._rebuild_lock.locked()
+
+        compile_inventory = mocker.patch('grizzly_ls.server.compile_inventory', side_effect=compile_inventory_mock)
+
+        command_rebuild_inventory(ls)
+
+        compile_inventory.assert_called_once_with(ls)
+        assert ls._ready.is_set()
+
+        compile_inventory.side_effect = RuntimeError('error')
+        show_message_mock = mocker.patch.object(ls, 'show_message', autospec=True)
+
+        command_rebuild_inventory(ls)
+
+        assert ls._ready.is_set()
+        show_message_mock.assert_called_once_with('failed to rebuild inventory', msg_type=lsp.MessageType.Error)
+
+    def test_completion_blank_line(self, lsp_fixture: LspFixture, mocker: MockerFixture) -> None:
+        ls = lsp_fixture.server
+        ls.root_path = GRIZZLY_PROJECT
+        ls.lsp._workspace = Workspace(ls.root_path.as_uri())
+        compile_inventory(ls)
+
+        get_step_parts_mock = mocker.patch('grizzly_ls.server.get_step_parts', autospec=True)
+        uri = 'file:///test.feature'
+        text_document = lsp.TextDocumentIdentifier(uri=uri)
+
+        ls.workspace.put_text_document(lsp.TextDocumentItem(uri=uri, language_id='grizzly-gherkin', version=1, text='Feature:\n  Scenario: test\n    \n'))
+
+        try:
+            # nothing typed on the line, only keywords are suggested
+            completion = text_document_completion(ls, lsp.CompletionParams(text_document=text_document, position=lsp.Position(line=2, character=4)))
+            labels = [item.label for item in completion.items]
+
+            assert 'Given' in labels
+            assert 'Then' in labels
+            assert 'Feature' not in labels
+            get_step_parts_mock.assert_not_called()
+        finally:
+            ls.workspace.remove_text_document(uri)
+
+    def test_not_ready(self, lsp_fixture: LspFixture) -> None:
+        ls = lsp_fixture.server
+        text_document = lsp.TextDocumentIdentifier(uri='file:///test.feature')
+        position = lsp.Position(line=0, character=0)
+
+        try:
+            ls._ready.clear()
+
+            completion = text_document_completion(ls, lsp.CompletionParams(text_document=text_document, position=position))
+            assert completion.items == []
+            assert completion.is_incomplete
+
+            assert text_document_hover(ls, lsp.HoverParams(text_document=text_document, position=position)) is None
+            assert text_document_definition(ls, lsp.DefinitionParams(text_document=text_document, position=position)) is None
+            assert workspace_diagnostic(ls, lsp.WorkspaceDiagnosticParams(previous_result_ids=[])).items == []
+        finally:
+            ls._ready.set()
+
+
+def test__uri_to_path() -> None:
+    assert _uri_to_path('file:///home/user/my%20project') == Path('/home/user/my project')
+    assert _uri_to_path('file:///c%3A/Users/user/project') == Path('c:/Users/user/project')
+    assert _uri_to_path('file:///C:/Users/user/project') == Path('C:/Users/user/project')
+    assert _uri_to_path('file://localhost/home/user/project') == Path('/home/user/project')
+    assert _uri_to_path('file://server/share/project') == Path('//server/share/project')
+
+
+def test__read_pip_index_url(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv('XDG_CONFIG_HOME', str(tmp_path / 'user'))
+    monkeypatch.setattr('sys.prefix', str(tmp_path / 'site'))
+    monkeypatch.delenv('PIP_CONFIG_FILE', raising=False)
+
+    user_config_file = tmp_path / 'user' / 'pip' / 'pip.conf'
+    site_config_file = tmp_path / 'site' / 'pip.conf'
+    config_files = _get_pip_config_files()
+    assert config_files.index(user_config_file) < config_files.index(site_config_file)
+
+    env_config_file = tmp_path / 'env.conf'
+    env_config_file.write_text('[global]\nindex-url = https://env.example.com/simple\n')
+    monkeypatch.setenv('PIP_CONFIG_FILE', str(env_config_file))
+
+    # user configuration is skipped when an existing file is specified in environment, which has the highest precedence
+    config_files = _get_pip_config_files()
+    assert config_files[-1] == env_config_file
+    assert user_config_file not in config_files
+
+    site_config_file.parent.mkdir(parents=True)
+    site_config_file.write_text('[global]\nindex-url = https://site.example.com/simple\n')
+    assert _read_pip_index_url() == 'https://env.example.com/simple'
+
+    # no configuration files are loaded if environment configuration file is the null device
+    monkeypatch.setenv('PIP_CONFIG_FILE', devnull)
+    assert _get_pip_config_files() == []
+    assert _read_pip_index_url() is None
+
+    monkeypatch.setattr('grizzly_ls.server._get_pip_config_files', lambda: [user_config_file, tmp_path / 'missing.conf', env_config_file])
+    assert _read_pip_index_url() == 'https://env.example.com/simple'
+
+    # later files has precedence
+    monkeypatch.setattr('grizzly_ls.server._get_pip_config_files', lambda: [env_config_file, tmp_path / 'missing.conf', user_config_file])
+    user_config_file.parent.mkdir(parents=True)
+    user_config_file.write_text('[global]\nindex_url = https://%(user)s@user.example.com/simple\n')
+    assert _read_pip_index_url() == 'https://%(user)s@user.example.com/simple'
+
+    user_config_file.write_text('index-url = https://user.example.com/simple\n')
+    assert _read_pip_index_url() is None
+
+
+def test_import_without_pip_internals() -> None:
+    output = subprocess.check_output(
+        [sys.executable, '-c', 'import sys, grizzly_ls.server; print(any(module.startswith("pip._internal") for module in sys.modules))'],
+        stderr=subprocess.DEVNULL,
+        text=True,
+    )
+
+    assert output.strip() == 'False'
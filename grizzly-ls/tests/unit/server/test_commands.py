@@ -2,10 +2,14 @@ from __future__ import annotations
 
 from pathlib import Path
 
-from grizzly_ls.server.commands import render_gherkin
+from pytest_mock import MockerFixture
 
+from grizzly_ls.server import commands
+from grizzly_ls.server.commands import render_gherkin, _get_template
 
-def test_render_gherkin() -> None:
+
+def test_render_gherkin(mocker: MockerFixture) -> None:
+    remove_if_statements_spy = mocker.spy(commands, 'remove_if_statements')
     feature_file = Path(__file__).parent.parent.parent.parent.parent / 'tests' / 'project' / 'features' / 'render.feature'
 
     assert feature_file.exists()
@@ -25,6 +29,8 @@ def test_render_gherkin() -> None:
 """
     )
 
+    _get_template.cache_clear()
+
     assert (
         render_gherkin(feature_file.as_posix(), content)
         == """Feature: Template feature file
@@ -48,3 +54,10 @@ def test_render_gherkin() -> None:
     Then log message "{{ foobar }}"
 """.rstrip()
     )
+
+    # same content for the same file should not be compiled again
+    render_gherkin(feature_file.as_posix(), content)
+    remove_if_statements_spy.assert_called_once_with(content)
+
+    # only comment lines are sanitized
+    assert render_gherkin(feature_file.as_posix(), 'Feature: <b>\n  # <i>\n\n#<u>\n\tGiven a "<tag>"') == 'Feature: <b>\n  # &lt;i&gt;\n\n#&lt;u&gt;\n\tGiven a "<tag>"'
@@ -7,7 +7,9 @@ import pytest
 from pytest_mock import MockerFixture
 from _pytest.logging import LogCaptureFixture
 
+from grizzly_ls.model import Step
 from grizzly_ls.server.inventory import (
+    StepIndex,
     _filter_source_directories,
     compile_inventory,
     create_step_normalizer,
@@ -26,6 +28,106 @@ from tests.helpers import (
 )
 
 
+def test_step_index() -> None:
+    def noop() -> None:
+        pass
+
+    steps = {
+        'given': [
+            Step('given', 'a user of type ""', noop, 'help for user'),
+            Step('given', 'a user of type "" with weight ""', noop, 'help for user with weight'),
+            Step('given', 'no help', noop),
+        ],
+        'step': [
+            Step('step', 'a user of type ""', noop, 'help for user, again'),
+            Step('step', 'value for variable "" is ""', noop, 'help for variable'),
+        ],
+    }
+
+    index = StepIndex(steps)
+
+    assert index.exact_help == {
+        'a user of type ""': 'help for user',
+        'a user of type "" with weight ""': 'help for user with weight',
+        'no help': None,
+        'value for variable "" is ""': 'help for variable',
+    }
+    assert index.expressions == sorted(index.expressions)
+    # first step in a keyword, last keyword wins
+    assert index.expression_steps == {
+        'a user of type ""': steps['step'][0],
+        'a user of type "" with weight ""': steps['given'][1],
+        'no help': steps['given'][2],
+        'value for variable "" is ""': steps['step'][1],
+    }
+
+    assert index.find_prefix_help('a user') == 'help for user with weight'
+    assert index.find_prefix_help('a user of type ""') == 'help for user with weight'
+    assert index.find_prefix_help('a user of type "" ') == 'help for user with weight'
+    assert index.find_prefix_help('value') == 'help for variable'
+    assert index.find_prefix_help('no') is None
+    assert index.find_prefix_help('foo') is None
+    assert index.find_prefix_help('') == 'help for variable'
+
+    assert index.find_help('no help', exact=True) is None
+    assert index.find_help('no help', exact=False) is None
+    assert index.find_help('a user of type ""', exact=True) == 'help for user'
+    assert index.find_help('a user of type ""', exact=False) == 'help for user with weight'
+    assert index.help_cache.cache_info().currsize == 4
+    assert index.find_help('no help', exact=True) is None
+    assert index.help_cache.cache_info().hits == 1
+
+    assert index.keyword_expressions == {
+        'given': ['a user of type ""', 'a user of type "" with weight ""', 'no help'],
+        'step': ['a user of type ""', 'value for variable "" is ""'],
+    }
+    assert index.find_prefix_expressions('given', 'a user') == ['a user of type ""', 'a user of type "" with weight ""']
+    assert index.find_prefix_expressions('given', 'a user of type "" ') == ['a user of type "" with weight ""']
+    assert index.find_prefix_expressions('step', '') == ['a user of type ""', 'value for variable "" is ""']
+    assert index.find_prefix_expressions('step', 'foo') == []
+    assert index.find_prefix_expressions('then', 'a user') == []
+
+    assert index.find_keywords_expressions(('given', 'step')) == [
+        'a user of type ""',
+        'a user of type "" with weight ""',
+        'no help',
+        'a user of type ""',
+        'value for variable "" is ""',
+    ]
+    assert index.find_keywords_expressions(('then',)) == []
+    assert index.keywords_expressions_cache.keys() == {('given', 'step'), ('then',)}
+
+    assert index.find_containing_expressions(('given', 'step'), 'of type ""') == ['a user of type ""', 'a user of type "" with weight ""', 'a user of type ""']
+    assert index.find_containing_expressions(('step',), 'hello') == []
+    assert index.containing_expressions_cache.cache_info().currsize == 2
+
+    assert index.find_close_expressions(('given', 'step'), 'a usr of type ""') == ['a user of type ""', 'a user of type ""', 'a user of type "" with weight ""']
+    assert index.find_close_expressions(('step',), 'hello') == []
+    assert index.close_expressions_cache.cache_info().currsize == 2
+    assert index.find_close_expressions(('step',), 'hello') == []
+    assert index.close_expressions_cache.cache_info().hits == 1
+    assert index.close_expressions_cache.cache_info().maxsize is not None
+
+    assert index.expression_shells == {'a user of type ""', 'a user of type "" with weight ""', 'no help', 'value for variable "" is ""'}
+    assert index.has_expression_shell('a user of type "foo" with weight "10"')
+    assert index.has_expression_shell('value for variable "foo" is "bar"')
+    assert not index.has_expression_shell('a user of type "foo" with weight')
+    assert not index.has_expression_shell('value for variable "foo" is "bar')
+
+    assert index.is_current(steps)
+    steps['given'].append(Step('given', 'foo', noop))
+    assert not index.is_current(steps)
+
+    index = StepIndex(steps)
+    assert index.is_current(steps)
+    steps['given'] = steps['given'].copy()
+    assert not index.is_current(steps)
+
+    index = StepIndex(steps)
+    steps.update({'then': []})
+    assert not index.is_current(steps)
+
+
 def test_create_normalizer(lsp_fixture: LspFixture, mocker: MockerFixture) -> None:
     ls = lsp_fixture.server
     namespace = 'grizzly_ls.server.inventory'
@@ -179,6 +281,15 @@ def test_compile_inventory(lsp_fixture: LspFixture, caplog: LogCaptureFixture, m
     for keyword in ['given', 'then', 'when']:
         assert keyword in keywords
 
+    # normalizer, and its cache, is kept if custom types has not changed
+    normalizer = ls.normalizer
+    compile_inventory(ls)
+    assert ls.normalizer is normalizer
+
+    normalizer.custom_types = {}
+    compile_inventory(ls)
+    assert ls.normalizer is not normalizer
+
 
 def test_compile_keyword_inventory(lsp_fixture: LspFixture) -> None:
     ls = lsp_fixture.server
@@ -199,3 +310,10 @@ def test_compile_keyword_inventory(lsp_fixture: LspFixture) -> None:
     assert 'Scenario' in ls.keywords  # can be used multiple times
     assert 'Given' in ls.keywords  # - " -
     assert 'When' in ls.keywords
+    assert ls.keywords == sorted(ls.keywords)
+    assert ls.keywords_once == ['Background', 'Feature']
+
+    assert ls.keywords_scenario_pattern.search('Feature: test\n  Scenario Outline: test') is not None
+    assert ls.keywords_scenario_pattern.search('Feature: test\n  Background:') is None
+    assert sorted(ls.keywords_once_pattern.findall('Feature: test\n  Background:\n  Scenario: test')) == ['Background', 'Feature']
+    assert ls.keywords_once_pattern.findall('Feature test') == []
@@ -29,9 +29,12 @@ from grizzly_ls.text import (
     SreParseValue,
     SreParseValueMaxRepeat,
     get_step_parts,
+    get_expression_shell,
     format_arg_line,
     get_current_line,
     find_language,
+    find_language_header,
+    LANGUAGE_NAMES,
 )
 
 
@@ -251,6 +254,20 @@ def test_get_step_parts() -> None:
         'Then',
         'make sure that "value" is "None"',
     )
+    assert get_step_parts('    Given ') == (
+        'Given',
+        '',
+    )
+    assert get_step_parts('    Given a user  ') == (
+        'Given',
+        'a user ',
+    )
+
+
+def test_get_expression_shell() -> None:
+    assert get_expression_shell('hello world') == 'hello world'
+    assert get_expression_shell('value for variable "foo" is "bar"') == 'value for variable "" is ""'
+    assert get_expression_shell('value for variable "" is "bar') == 'value for variable "" is "bar'
 
 
 def test__format_arg_line() -> None:
@@ -284,3 +301,20 @@ def test_find_language() -> None:
     assert find_language('# language: asdf') == 'asdf'
     assert find_language('# language: s') == 'en'
     assert find_language('# language: en-US') == 'en-US'
+    assert find_language('# some comment\n\n# language: sv\nFeature: test') == 'sv'
+    assert find_language('Feature: test\n# language: sv\n') == 'en'
+
+
+def test_find_language_header() -> None:
+    assert find_language_header('') == ('en', None)
+    assert find_language_header('# some comment\n\n') == ('en', None)
+    assert find_language_header('# some comment\n\n# language: sv\nFeature: test') == ('sv', 2)
+    assert find_language_header('# language: s\nFeature: test') == ('en', 0)
+    assert find_language_header('\n# comment\nFeature: test\n# language: sv\n') == ('en', 2)
+    assert find_language_header('# comment\r\n# language: sv\r\nEgenskap: test\r\n') == ('sv', 1)
+    assert find_language_header('\n\n\n') == ('en', None)
+
+
+def test_language_names() -> None:
+    assert ('sv', 'swedish', 'svenska') in LANGUAGE_NAMES
+    assert ('en', 'english', 'english') in LANGUAGE_NAMES
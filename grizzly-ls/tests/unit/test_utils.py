@@ -0,0 +1,71 @@
+import sys
+import logging
+import subprocess
+
+import pytest
+
+from pytest_mock import MockerFixture
+
+from lsprotocol import types as lsp
+
+from grizzly_ls.utils import run_command, run_command_iter, LogOutputChannelLogger
+from grizzly_ls.server import server
+
+
+def test_run_command() -> None:
+    rc, output = run_command([sys.executable, '-c', 'import sys; print("hello"); print("world"); sys.exit(3)'])
+
+    assert rc == 3
+    assert output == ['hello\n', 'world\n']
+
+    rc, output = run_command([sys.executable, '-c', 'import sys; sys.stderr.write("error!\\n")'])
+
+    assert rc == 0
+    assert output == ['error!\n']
+
+
+def test_run_command_iter(mocker: MockerFixture) -> None:
+    lines = run_command_iter([sys.executable, '-c', 'import sys; print("hello"); sys.stdout.flush(); print("world"); sys.exit(3)'])
+
+    assert next(lines) == 'hello\n'
+    assert next(lines) == 'world\n'
+
+    with pytest.raises(StopIteration) as si:
+        next(lines)
+    assert si.value.value == 3
+
+    # command is stopped when the generator is closed before all output is read
+    popen_spy = mocker.spy(subprocess, 'Popen')
+    lines = run_command_iter([sys.executable, '-c', 'import sys, time; print("hello"); sys.stdout.flush(); time.sleep(60)'])
+
+    assert next(lines) == 'hello\n'
+    lines.close()
+
+    process = popen_spy.spy_return
+    assert process.poll() is not None
+    assert process.stdout.closed
+
+
+def test_log_output_channel_logger_py2lsp_level() -> None:
+    assert LogOutputChannelLogger.py2lsp_level(logging.INFO) == lsp.MessageType.Info
+    assert LogOutputChannelLogger.py2lsp_level(logging.ERROR) == lsp.MessageType.Error
+    assert LogOutputChannelLogger.py2lsp_level(logging.WARNING) == lsp.MessageType.Warning
+    assert LogOutputChannelLogger.py2lsp_level(logging.DEBUG) == lsp.MessageType.Debug
+    assert LogOutputChannelLogger.py2lsp_level(logging.CRITICAL) == lsp.MessageType.Log
+
+
+def test_log_output_channel_logger_is_enabled_for() -> None:
+    logger = LogOutputChannelLogger(server)
+    level = logger.logger.level
+
+    try:
+        logger.logger.setLevel(logging.INFO)
+
+        assert logger.is_enabled_for(logging.INFO)
+        assert not logger.is_enabled_for(logging.DEBUG)
+
+        # all messages are sent to the output channel
+        logger.embedded = True
+        assert logger.is_enabled_for(logging.DEBUG)
+    finally:
+        logger.logger.setLevel(level)
@@ -1,2 +0,0 @@
-class RandomWords:
-    def get_random_word(self) -> str: ...